@@ -4,7 +4,7 @@ MySQL 数据库连接
 import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,6 +27,9 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 线程内共享的会话（检索时同一请求内的多次权限查询复用，由最外层调用方 remove）
+ScopedSession = scoped_session(SessionLocal)
+
 Base = declarative_base()
 
 
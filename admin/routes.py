@@ -52,6 +52,12 @@ def mask_api_key(api_key: str) -> str:
     return api_key[:4] + "****" + api_key[-4:]
 
 
+def _invalidate_access_cache():
+    """分组/共享/知识条目变更后，使检索侧的用户可访问知识缓存失效"""
+    from retriever.hybrid_search import invalidate_user_access_cache
+    invalidate_user_access_cache()
+
+
 # ============================================================
 # 认证接口
 # ============================================================
@@ -965,12 +971,10 @@ async def get_knowledge(
     # 从 Qdrant 获取完整内容
     content = None
     try:
-        from qdrant_client import QdrantClient
-        from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+        from utils.config_manager import get_config
+        from config import QDRANT_COLLECTION_NAME
 
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+        client = get_config().qdrant_client
 
         # 通过 qdrant_id 获取完整内容
         points = client.retrieve(
@@ -1097,14 +1101,10 @@ async def delete_knowledge(
     # 1. 从 Qdrant 删除向量
     qdrant_delete_failed = False
     try:
-        from qdrant_client import QdrantClient
-        from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME
+        from utils.config_manager import get_config
+        from config import QDRANT_COLLECTION_NAME
 
-        client = QdrantClient(
-            host=QDRANT_HOST,
-            port=QDRANT_PORT,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
-        )
+        client = get_config().qdrant_client
 
         # 按 qdrant_id 删除
         client.delete(
@@ -1119,6 +1119,7 @@ async def delete_knowledge(
     # 2. 从 MySQL 删除
     db.delete(entry)
     db.commit()
+    _invalidate_access_cache()
 
     # 返回适当的消息
     if qdrant_delete_failed:
@@ -1165,14 +1166,10 @@ async def delete_knowledge_by_qdrant_id(
     # 1. 从 Qdrant 删除向量
     qdrant_delete_failed = False
     try:
-        from qdrant_client import QdrantClient
-        from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME
+        from utils.config_manager import get_config
+        from config import QDRANT_COLLECTION_NAME
 
-        client = QdrantClient(
-            host=QDRANT_HOST,
-            port=QDRANT_PORT,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
-        )
+        client = get_config().qdrant_client
         client.delete(
             collection_name=QDRANT_COLLECTION_NAME,
             points_selector={"points": [qdrant_id]}
@@ -1187,6 +1184,7 @@ async def delete_knowledge_by_qdrant_id(
     # 3. 从 MySQL 删除
     db.delete(entry)
     db.commit()
+    _invalidate_access_cache()
 
     if qdrant_delete_failed:
         return MessageResponse(message="知识条目已从索引删除，但向量数据删除失败")
@@ -1811,9 +1809,9 @@ async def get_cache_stats(
 ):
     """获取语义缓存统计"""
     try:
-        from retriever.semantic_cache import SemanticCache
+        from retriever.semantic_cache import get_semantic_cache
 
-        cache = SemanticCache()
+        cache = get_semantic_cache()
         stats = cache.get_stats()
 
         # 解析 hit_rate（可能是字符串格式如 "85.00%"）
@@ -1842,9 +1840,9 @@ async def clear_cache(
 ):
     """清空语义缓存"""
     try:
-        from retriever.semantic_cache import SemanticCache
+        from retriever.semantic_cache import get_semantic_cache
 
-        cache = SemanticCache()
+        cache = get_semantic_cache()
         cache.clear()
 
         return MessageResponse(message="缓存已清空")
@@ -1861,10 +1859,10 @@ async def import_knowledge(
     """批量导入知识条目"""
     try:
         import json
-        from qdrant_client import QdrantClient
+        from utils.config_manager import get_config
         from qdrant_client.models import PointStruct
         from utils.embeddings import EmbeddingModel
-        from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+        from config import QDRANT_COLLECTION_NAME
         import hashlib
 
         # 解析JSON
@@ -1879,9 +1877,7 @@ async def import_knowledge(
             raise HTTPException(status_code=400, detail="没有找到有效的条目")
         
         # 初始化客户端
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        qdrant_client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+        qdrant_client = get_config().qdrant_client
         embedding_model = EmbeddingModel()
         
         success_count = 0
@@ -1940,6 +1936,7 @@ async def import_knowledge(
                 continue
         
         db.commit()
+        _invalidate_access_cache()
         
         return MessageResponse(
             message=f"导入完成！成功: {success_count}, 失败: {error_count}"
@@ -2134,6 +2131,7 @@ async def update_group(
 
     db.commit()
     db.refresh(group)
+    _invalidate_access_cache()
 
     items_count = db.query(func.count(KnowledgeGroupItem.id)).filter(KnowledgeGroupItem.group_id == group.id).scalar() or 0
 
@@ -2165,6 +2163,7 @@ async def delete_group(
 
     db.delete(group)
     db.commit()
+    _invalidate_access_cache()
     return MessageResponse(message="分组已删除")
 
 
@@ -2251,6 +2250,7 @@ async def add_group_items(
         added += 1
 
     db.commit()
+    _invalidate_access_cache()
     return MessageResponse(message=f"已添加 {added} 条，跳过 {skipped} 条（已存在）")
 
 
@@ -2272,6 +2272,7 @@ async def remove_group_items(
     ).delete(synchronize_session=False)
 
     db.commit()
+    _invalidate_access_cache()
     return MessageResponse(message=f"已移除 {removed} 条")
 
 
@@ -2367,13 +2368,11 @@ async def rollback_knowledge(
 
     try:
         # 1. 更新 Qdrant 中的内容
-        from qdrant_client import QdrantClient
-        from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+        from utils.config_manager import get_config
+        from config import QDRANT_COLLECTION_NAME
         from utils.embeddings import EmbeddingModel
 
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+        client = get_config().qdrant_client
 
         # 重新计算嵌入
         embedding_model = EmbeddingModel()
@@ -2411,6 +2410,8 @@ async def rollback_knowledge(
             entry.content_preview = target_version.content[:500]
 
         db.commit()
+        # 回滚改写了向量内容，清掉检索结果缓存中的旧内容
+        _invalidate_access_cache()
 
         return RollbackResponse(
             success=True,
@@ -2959,6 +2960,7 @@ async def create_group_share(
     )
     db.add(share)
     db.commit()
+    _invalidate_access_cache()
     db.refresh(share)
 
     return GroupShareResponse(
@@ -3036,6 +3038,7 @@ async def delete_group_share(
 
     db.delete(share)
     db.commit()
+    _invalidate_access_cache()
     return MessageResponse(message="已取消共享")
 
 
@@ -21,9 +21,9 @@ from retriever.vector_store import VectorStore
 from utils.llm import get_llm_client
 from utils.embeddings import EmbeddingModel
 from utils.logger import logger
-from qdrant_client import QdrantClient
 from qdrant_client.models import PointStruct
-from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+from config import QDRANT_COLLECTION_NAME
+from utils.config_manager import get_config
 import hashlib
 from datetime import datetime
 
@@ -127,10 +127,8 @@ async def startup_event() -> None:
         llm_client = get_llm_client()
         embedding_model = EmbeddingModel()
 
-        # 初始化 Qdrant 客户端
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        qdrant_client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+        # Qdrant 客户端（与 VectorStore 共用同一个实例）
+        qdrant_client = get_config().qdrant_client
 
         # 初始化 Agent 框架（如果可用）
         if AGENT_AVAILABLE:
@@ -143,6 +141,13 @@ async def startup_event() -> None:
             except Exception as agent_err:
                 logger.warning(f"Agent 框架初始化失败（非致命）: {agent_err}")
 
+        # Reranker ONNX 模型缺失且开启自动导出时，启动即在后台导出，不占用首个检索请求
+        try:
+            from retriever.reranker import start_onnx_export
+            start_onnx_export()
+        except Exception as export_err:
+            logger.warning(f"Reranker ONNX 导出启动失败（非致命）: {export_err}")
+
         # 启动定时索引调度器
         try:
             start_scheduler()
@@ -36,6 +36,9 @@ QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")  # 远程 Qdrant 认证密钥
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "knowledge_base")
 QDRANT_USE_HTTPS = os.getenv("QDRANT_USE_HTTPS", "false").lower() in ("1", "true", "yes")
+# 语义缓存优先走 gRPC（需 Qdrant 开放 gRPC 端口）
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 
 # ============================================================
 # 项目路径配置
@@ -63,6 +66,21 @@ EMBEDDING_API_BASE = os.getenv("EMBEDDING_API_BASE", "https://api.openai.com")
 TOP_K = int(os.getenv("TOP_K", "5"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "512"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+# 单词查询跳过 FTS5 的 rank 排序，取少量匹配后在本地近似 BM25 排序（结果为近似值）
+KEYWORD_FAST_PATH = os.getenv("KEYWORD_FAST_PATH", "0").lower() in ("1", "true", "yes")
+# 混合检索融合方式: "weighted" 按权重加权分数（分数为 0-1 相似度）, "rrf" 倒数排名融合（分数仅用于排序）
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "weighted").lower()
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# 检索结果缓存（秒，0 关闭）与容量：相同问题、相同权限范围的重复检索直接复用结果
+SEARCH_RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "30"))
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "512"))
+# 关键词索引分词结果的 LRU 缓存条数（标题、分类、重复查询命中后不再调用 jieba）
+PREPROCESS_CACHE_SIZE = int(os.getenv("PREPROCESS_CACHE_SIZE", "8192"))
+# 启动时在后台线程预加载 jieba 词典，避免首个查询承担词典加载耗时
+JIEBA_PRELOAD = os.getenv("JIEBA_PRELOAD", "1").lower() in ("1", "true", "yes")
+# 批量建关键词索引时的分词进程数（0 关闭，在当前进程分词）与启用并行的最小批量
+KEYWORD_TOKENIZE_WORKERS = int(os.getenv("KEYWORD_TOKENIZE_WORKERS", "0"))
+KEYWORD_TOKENIZE_MIN_BATCH = int(os.getenv("KEYWORD_TOKENIZE_MIN_BATCH", "256"))
 
 # ============================================================
 # Reranker 重排配置
@@ -72,9 +90,21 @@ RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "BAAI/bge-reranker-base")
 RERANKER_DEVICE = os.getenv("RERANKER_DEVICE", "cpu")
 RERANKER_TOP_K_MULTIPLIER = int(os.getenv("RERANKER_TOP_K_MULTIPLIER", "3"))
 RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
-RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "8"))  # 批处理大小
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))  # 批处理大小（候选数不超过时一次前向计算）
 RERANKER_CACHE_SIZE = int(os.getenv("RERANKER_CACHE_SIZE", "100"))  # 缓存条目数
 RERANKER_CACHE_TTL = int(os.getenv("RERANKER_CACHE_TTL", "300"))  # 缓存过期时间（秒）
+RERANKER_SHARED_CACHE_PATH = os.getenv("RERANKER_SHARED_CACHE_PATH", "")  # 多 worker 共享的 SQLite 二级缓存路径（留空仅用进程内缓存）
+RERANKER_ONNX_PATH = os.getenv("RERANKER_ONNX_PATH", "")  # INT8 量化 ONNX 模型路径（留空使用 PyTorch FP32）
+RERANKER_ONNX_THREADS = int(os.getenv("RERANKER_ONNX_THREADS", "0"))  # ONNX 算子内线程数（0 为自动，按物理核数）
+RERANKER_ONNX_EXPORT = os.getenv("RERANKER_ONNX_EXPORT", "0").lower() in ("1", "true", "yes")  # ONNX 模型缺失时在后台线程用 optimum 导出并 INT8 量化（导出期间使用 PyTorch）
+RERANKER_MMR_ENABLE = os.getenv("RERANKER_MMR_ENABLE", "1").lower() in ("1", "true", "yes")  # 重排前 MMR 去重
+RERANKER_MMR_LAMBDA = float(os.getenv("RERANKER_MMR_LAMBDA", "0.7"))  # MMR 相关性权重
+RERANKER_MMR_MULTIPLIER = int(os.getenv("RERANKER_MMR_MULTIPLIER", "2"))  # MMR 保留 top_k * N 个候选送入重排
+RERANKER_MIN_CANDIDATES = int(os.getenv("RERANKER_MIN_CANDIDATES", "0"))  # 候选数低于此值时跳过重排
+RERANKER_MAX_CANDIDATES = int(os.getenv("RERANKER_MAX_CANDIDATES", "50"))  # 最多对前 N 个候选做交叉编码（0 为不限制）
+RERANKER_FP16 = os.getenv("RERANKER_FP16", "1").lower() in ("1", "true", "yes")  # CUDA 上以 FP16 推理（CPU 始终 FP32）
+RERANKER_SKIP_LITERAL = os.getenv("RERANKER_SKIP_LITERAL", "1").lower() in ("1", "true", "yes")  # 文件名/引号短语等字面查询且关键词命中居首时跳过重排
+RERANKER_COMPILE = os.getenv("RERANKER_COMPILE", "0").lower() in ("1", "true", "yes")  # torch.compile 融合算子（首次请求需额外编译时间）
 
 # ============================================================
 # Query 改写配置
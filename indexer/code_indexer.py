@@ -4,14 +4,14 @@
 import os
 from pathlib import Path
 from typing import List, Dict
-from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 import hashlib
 
 from config import (
     PROJECT_ROOT, CODE_PATTERNS, IGNORE_PATTERNS,
-    QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+    QDRANT_COLLECTION_NAME
 )
+from utils.config_manager import get_config
 from utils.embeddings import EmbeddingModel
 from utils.logger import logger
 from .chunker import CodeChunker
@@ -24,13 +24,8 @@ class CodeIndexer:
     def __init__(self):
         self.embedding_model = EmbeddingModel()
         self.chunker = CodeChunker()
-        # 使用 URL 模式连接 Qdrant（明确指定 HTTP/HTTPS）
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        self.qdrant_client = QdrantClient(
-            url=url,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
-        )
+        # 复用进程内共享的 Qdrant 客户端（URL 模式，明确指定 HTTP/HTTPS）
+        self.qdrant_client = get_config().qdrant_client
         self.collection_name = QDRANT_COLLECTION_NAME
         self._ensure_collection()
     
@@ -164,22 +159,17 @@ class CodeIndexer:
 
         # 同时写入关键词索引（用于混合检索）
         keyword_manager = KeywordIndexManager()
-        for i, chunk in enumerate(chunks):
-            chunk_id = self._generate_id(str(file_path), chunk["chunk_index"])
-            metadata = {
+        keyword_manager.add_documents_batch([
+            {
+                "doc_id": self._generate_id(str(file_path), chunk["chunk_index"]),
+                "content": chunk["content"],
+                "title": chunk.get("context_prefix", ""),  # 上下文信息作为 title 参与检索
                 "file_path": str(file_path),
-                "type": "code",
-                "language": language,
-                "symbol": chunk.get("symbol", ""),
+                "category": "code",
+                "chunk_index": chunk["chunk_index"]
             }
-            # 添加上下文信息到关键词索引
-            if "context_prefix" in chunk:
-                metadata["context_prefix"] = chunk["context_prefix"]
-            keyword_manager.add_document(
-                doc_id=chunk_id,
-                content=chunk["content"],
-                metadata=metadata
-            )
+            for chunk in chunks
+        ])
 
         logger.info(f"索引文件: {file_path} ({len(chunks)} 块)")
         return len(chunks)
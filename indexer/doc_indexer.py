@@ -3,7 +3,6 @@
 """
 from pathlib import Path
 from typing import List, Dict
-from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct, CollectionStatus
 import hashlib
 import markdown
@@ -11,8 +10,9 @@ from bs4 import BeautifulSoup
 
 from config import (
     PROJECT_ROOT, IGNORE_PATTERNS,
-    QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+    QDRANT_COLLECTION_NAME
 )
+from utils.config_manager import get_config
 from utils.embeddings import EmbeddingModel
 from utils.logger import logger
 from .chunker import DocumentChunker
@@ -25,13 +25,8 @@ class DocumentIndexer:
     def __init__(self):
         self.embedding_model = EmbeddingModel()
         self.chunker = DocumentChunker()
-        # 使用 URL 模式连接 Qdrant（明确指定 HTTP/HTTPS）
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        self.qdrant_client = QdrantClient(
-            url=url,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
-        )
+        # 复用进程内共享的 Qdrant 客户端（URL 模式，明确指定 HTTP/HTTPS）
+        self.qdrant_client = get_config().qdrant_client
         self.collection_name = QDRANT_COLLECTION_NAME
         self._ensure_collection()
 
@@ -257,17 +252,18 @@ class DocumentIndexer:
             points=points
         )
 
-        # 同时写入关键词索引（用于混合检索）
-        for i, chunk in enumerate(chunks):
-            chunk_id = self._generate_id(str(file_path), chunk["chunk_index"])
-            # 使用包含上下文的内容用于关键词索引
-            self.keyword_index.add_document(
-                doc_id=chunk_id,
-                content=chunk["content"],
-                title=chunk.get("context_prefix", ""),  # 用 context_prefix 作为 title
-                file_path=str(file_path),
-                category=doc_type
-            )
+        # 同时写入关键词索引（用于混合检索），整个文件一次批量写入
+        self.keyword_index.add_documents_batch([
+            {
+                "doc_id": self._generate_id(str(file_path), chunk["chunk_index"]),
+                "content": chunk["content"],
+                "title": chunk.get("context_prefix", ""),  # 用 context_prefix 作为 title
+                "file_path": str(file_path),
+                "category": doc_type,
+                "chunk_index": chunk["chunk_index"]
+            }
+            for chunk in chunks
+        ])
 
         logger.info(f"索引文档: {file_path} ({len(chunks)} 块)")
         return len(chunks)
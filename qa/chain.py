@@ -1,18 +1,80 @@
 """
 LangChain 问答链
 """
-from typing import List, Dict, Generator, Optional
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Deque, List, Dict, Generator, Iterable, Iterator, Optional
 
+import numpy as np
+
+from config import CONVERSATION_MAX_HISTORY_TURNS
 from retriever.hybrid_search import HybridSearch
-from retriever.semantic_cache import SemanticCache
+from retriever.semantic_cache import SemanticCache, get_semantic_cache
 from utils.llm import get_llm_client
 from utils.logger import logger
 from .conversation_summarizer import ConversationSummarizer
 
+try:
+    from utils.reference_highlighter import find_reference_highlights
+except ImportError as e:
+    logger.warning(f"引用高亮模块不可用: {e}")
+    find_reference_highlights = None
+
 # 上下文限制配置
 MAX_CONTEXT_CHARS = 8000  # 最大上下文字符数（约 4000 tokens）
 MAX_SINGLE_CONTENT_CHARS = 2000  # 单条内容最大字符数
 
+# 对话历史上限（比摘要触发阈值多一轮，保证摘要能看到超出部分；摘要不可用时自动淘汰最早消息）
+MAX_HISTORY_MESSAGES = (CONVERSATION_MAX_HISTORY_TURNS + 1) * 2
+RECENT_HISTORY_MESSAGES = 6  # 无摘要时携带的最近消息数
+
+# 懒加载属性的未初始化标记（初始化结果可能为 None）
+_UNSET = object()
+
+# 流式输出合并配置：累计到一定字符数或距上次输出超过一定时间才下发一次
+STREAM_FLUSH_CHARS = 64
+STREAM_FLUSH_INTERVAL = 0.02  # 秒
+
+
+def _result_score(result: Dict) -> float:
+    """检索结果的展示分数（优先 Reranker 分数）"""
+    score = result.get("rerank_score")
+    return result.get("score", 0.0) if score is None else score
+
+
+def _coalesce_chunks(
+    chunks: Iterable[str],
+    flush_chars: int = STREAM_FLUSH_CHARS,
+    flush_interval: float = STREAM_FLUSH_INTERVAL
+) -> Iterator[str]:
+    """
+    合并 LLM 流式输出的细碎片段
+
+    减少下发事件数（每个事件都要构造 dict、JSON 序列化并写一个 SSE 帧），
+    同时保证延迟不超过 flush_interval（以下一个片段到达为准）。
+    """
+    buffer: List[str] = []
+    buffered_chars = 0
+    last_flush = time.monotonic()
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        buffered_chars += len(chunk)
+
+        now = time.monotonic()
+        if buffered_chars >= flush_chars or now - last_flush >= flush_interval:
+            yield "".join(buffer)
+            buffer.clear()
+            buffered_chars = 0
+            last_flush = now
+
+    if buffer:
+        yield "".join(buffer)
+
 
 class QAChatChain:
     """问答对话链"""
@@ -20,30 +82,94 @@ class QAChatChain:
     def __init__(self, enable_cache: bool = True, enable_summarization: bool = True):
         self.llm = get_llm_client()
         self.retriever = HybridSearch()
-        self.conversation_history = []
+        self.conversation_history: Deque[Dict] = self._new_history()
 
-        # 对话摘要相关
+        # 对话摘要与语义缓存均在首次使用时初始化
         self.enable_summarization = enable_summarization
         self.conversation_summary: Optional[str] = None  # 早期对话摘要
-        self.summarizer = None
-        if enable_summarization:
-            try:
-                self.summarizer = ConversationSummarizer(self.llm)
-                logger.info("对话摘要压缩已启用")
-            except Exception as e:
-                logger.warning(f"对话摘要初始化失败: {e}")
-                self.enable_summarization = False
-
-        # 初始化语义缓存
         self.enable_cache = enable_cache
-        self.semantic_cache = None
-        if enable_cache:
-            try:
-                self.semantic_cache = SemanticCache()
-                logger.info("语义缓存已启用")
-            except Exception as e:
-                logger.warning(f"语义缓存初始化失败，将禁用缓存: {e}")
-                self.enable_cache = False
+        # 问答链在 API 线程池中共享，懒加载需加锁（Python 3.12 起 cached_property 不再加锁）
+        self._lazy_init_lock = threading.Lock()
+        self._summarizer = _UNSET
+        self._semantic_cache = _UNSET
+
+    @property
+    def summarizer(self) -> Optional[ConversationSummarizer]:
+        """懒加载对话摘要器"""
+        if self._summarizer is _UNSET:
+            with self._lazy_init_lock:
+                if self._summarizer is _UNSET:
+                    self._summarizer = self._create_summarizer()
+        return self._summarizer
+
+    def _create_summarizer(self) -> Optional[ConversationSummarizer]:
+        """创建对话摘要器（初始化失败时禁用摘要）"""
+        if not self.enable_summarization:
+            return None
+        try:
+            summarizer = ConversationSummarizer(self.llm)
+            logger.info("对话摘要压缩已启用")
+            return summarizer
+        except Exception as e:
+            logger.warning(f"对话摘要初始化失败: {e}")
+            self.enable_summarization = False
+            return None
+
+    @property
+    def semantic_cache(self) -> Optional[SemanticCache]:
+        """懒加载语义缓存"""
+        if self._semantic_cache is _UNSET:
+            with self._lazy_init_lock:
+                if self._semantic_cache is _UNSET:
+                    self._semantic_cache = self._create_semantic_cache()
+        return self._semantic_cache
+
+    def _create_semantic_cache(self) -> Optional[SemanticCache]:
+        """获取进程内共享的语义缓存（初始化失败时禁用缓存）"""
+        if not self.enable_cache:
+            return None
+        try:
+            cache = get_semantic_cache()
+            logger.info("语义缓存已启用")
+            return cache
+        except Exception as e:
+            logger.warning(f"语义缓存初始化失败，将禁用缓存: {e}")
+            self.enable_cache = False
+            return None
+
+    @staticmethod
+    def _new_history(messages: Iterable[Dict] = ()) -> Deque[Dict]:
+        """创建定长对话历史（超出上限时 O(1) 淘汰最早消息）"""
+        return deque(messages, maxlen=MAX_HISTORY_MESSAGES)
+
+    def _embed_question(self, question: str) -> np.ndarray:
+        """计算问题向量（每次问答只调用一次嵌入模型）"""
+        return self.retriever.vector_store.embedding_model.embed_query(question)
+
+    @staticmethod
+    def _build_cache_scope(group_ids: Optional[List[int]], user_id: Optional[int]) -> str:
+        """构建语义缓存隔离范围，确保不同分组/用户的查询不会混淆"""
+        parts = []
+        if group_ids:
+            parts.append(f"groups:{','.join(str(g) for g in sorted(group_ids))}")
+        if user_id:
+            parts.append(f"user:{user_id}")
+        return "||".join(parts)
+
+    @staticmethod
+    def _build_sources(results: List[Dict], include_content: bool = False) -> List[Dict]:
+        """由检索结果构建返回给前端的来源列表"""
+        sources = []
+        for r in results:
+            source = {
+                "file_path": r.get("file_path", ""),
+                "score": _result_score(r),
+                "preview": r["preview"]
+            }
+            if include_content:
+                source["content"] = r.get("content", "")
+            sources.append(source)
+        return sources
 
     def _truncate_content(self, content: str, max_chars: int = MAX_SINGLE_CONTENT_CHARS) -> str:
         """截断过长的内容"""
@@ -61,17 +187,13 @@ class QAChatChain:
         for i, result in enumerate(results, 1):
             file_path = result.get("file_path", "未知")
             content = result.get("content", "")
-            score = result.get("rerank_score", result.get("score", 0.0))
+            score_str = format(_result_score(result), ".3f")
 
             # 截断单条内容
             content = self._truncate_content(content)
 
             # 构建当前条目
-            entry = (
-                f"[参考 {i}] 文件: {file_path}\n"
-                f"相似度: {score:.3f}\n"
-                f"内容:\n{content}\n"
-            )
+            entry = f"[参考 {i}] 文件: {file_path}\n相似度: {score_str}\n内容:\n{content}\n"
 
             # 检查是否超出总长度限制
             if current_chars + len(entry) > MAX_CONTEXT_CHARS:
@@ -90,12 +212,12 @@ class QAChatChain:
 
         if self.summarizer.should_summarize(self.conversation_history):
             result = self.summarizer.compress_history(
-                self.conversation_history,
+                list(self.conversation_history),
                 self.conversation_summary
             )
             if result["compressed"]:
                 self.conversation_summary = result["summary"]
-                self.conversation_history = result["recent_messages"]
+                self.conversation_history = self._new_history(result["recent_messages"])
                 logger.info(f"对话历史已压缩，摘要长度: {len(self.conversation_summary)} 字符")
 
     def _build_messages_with_history(self, prompt: str, use_history: bool) -> List[Dict]:
@@ -124,7 +246,8 @@ class QAChatChain:
                 )
             else:
                 # 没有摘要时，使用最近的对话历史
-                for msg in self.conversation_history[-6:]:  # 保留最近 6 轮
+                start = max(0, len(self.conversation_history) - RECENT_HISTORY_MESSAGES)
+                for msg in islice(self.conversation_history, start, None):
                     messages.append({
                         "role": msg["role"],
                         "content": msg["content"]
@@ -188,25 +311,22 @@ class QAChatChain:
         Returns:
             包含答案和检索结果的字典
         """
+        # 问题向量只计算一次，语义缓存与向量检索共用
+        query_vector = self._embed_question(question)
+
         # 1. 检查语义缓存（支持分组过滤和用户过滤）
-        cache_key = question
-        if group_ids:
-            # 将分组信息加入缓存键，确保不同分组的查询不会混淆
-            cache_key = f"{question}||groups:{','.join(str(g) for g in sorted(group_ids))}"
-        if user_id:
-            # 将用户ID加入缓存键，确保不同用户的查询不会混淆
-            cache_key = f"{cache_key}||user:{user_id}"
+        cache_scope = self._build_cache_scope(group_ids, user_id)
 
         if use_cache and self.semantic_cache:
-            cached = self.semantic_cache.get(cache_key)
+            cached = self.semantic_cache.get(question, query_vector=query_vector, scope=cache_scope)
             if cached:
                 logger.info(f"语义缓存命中: {question[:50]}..." + (f" [分组: {group_ids}]" if group_ids else "") + (f" [用户: {user_id}]" if user_id else ""))
                 return {
-                    "answer": cached["answer"],
-                    "sources": cached.get("sources", []),
-                    "retrieved_count": cached.get("retrieved_count", 0),
+                    "answer": cached.answer,
+                    "sources": cached.sources,
+                    "retrieved_count": len(cached.sources),
                     "from_cache": True,
-                    "cache_similarity": cached.get("similarity", 0.0)
+                    "cache_similarity": cached.similarity
                 }
 
         # 2. 检索相关文档（传入 user_id 进行权限过滤）
@@ -217,7 +337,8 @@ class QAChatChain:
             filters=filters,
             group_ids=group_ids,
             user_id=user_id,  # 传入用户ID
-            use_reranker=use_reranker
+            use_reranker=use_reranker,
+            query_vector=query_vector
         )
 
         if not results:
@@ -228,6 +349,9 @@ class QAChatChain:
                 "from_cache": False
             }
 
+        # 来源列表在调用 LLM 之前构建（保留完整内容用于高亮匹配）
+        sources = self._build_sources(results, include_content=True)
+
         # 格式化上下文
         context = self._format_context(results)
 
@@ -250,28 +374,18 @@ class QAChatChain:
                 self.conversation_history.append({"role": "assistant", "content": answer})
 
             # 构建响应
-            sources = [
-                {
-                    "file_path": r.get("file_path", ""),
-                    "score": r.get("rerank_score", r.get("score", 0.0)),
-                    "preview": r.get("content", "")[:200] + "...",
-                    "content": r.get("content", "")  # 保留完整内容用于高亮匹配
-                }
-                for r in results
-            ]
-
             # 引用高亮
             highlights = None
-            try:
-                from utils.reference_highlighter import find_reference_highlights
-                highlight_result = find_reference_highlights(answer, sources)
-                highlights = {
-                    "matches": highlight_result["matches"],
-                    "highlighted_answer": highlight_result["highlighted_answer"],
-                    "source_citations": highlight_result["source_citations"]
-                }
-            except Exception as e:
-                logger.warning(f"引用高亮处理失败: {e}")
+            if find_reference_highlights is not None:
+                try:
+                    highlight_result = find_reference_highlights(answer, sources)
+                    highlights = {
+                        "matches": highlight_result["matches"],
+                        "highlighted_answer": highlight_result["highlighted_answer"],
+                        "source_citations": highlight_result["source_citations"]
+                    }
+                except Exception as e:
+                    logger.warning(f"引用高亮处理失败: {e}")
 
             response = {
                 "answer": answer,
@@ -286,9 +400,12 @@ class QAChatChain:
                 }
             }
 
-            # 3. 存入语义缓存（使用相同的缓存键）
+            # 3. 存入语义缓存（使用相同的缓存范围）
             if use_cache and self.semantic_cache:
-                self.semantic_cache.set(cache_key, response)
+                self.semantic_cache.set(
+                    question, answer, sources,
+                    query_vector=query_vector, scope=cache_scope
+                )
 
             return response
 
@@ -303,7 +420,7 @@ class QAChatChain:
 
     def clear_history(self):
         """清空对话历史和摘要"""
-        self.conversation_history = []
+        self.conversation_history.clear()
         self.conversation_summary = None
         logger.info("对话历史和摘要已清空")
 
@@ -356,20 +473,20 @@ class QAChatChain:
             - {"type": "chunk", "data": "..."}    答案片段
             - {"type": "done", "data": "..."}     完整答案
         """
-        # 检查语义缓存（支持分组过滤）
-        cache_key = question
-        if group_ids:
-            cache_key = f"{question}||groups:{','.join(str(g) for g in sorted(group_ids))}"
+        # 问题向量只计算一次，语义缓存与向量检索共用
+        query_vector = self._embed_question(question)
+
+        # 检查语义缓存（支持分组过滤和用户过滤）
+        cache_scope = self._build_cache_scope(group_ids, user_id)
 
         if self.semantic_cache:
-            cached = self.semantic_cache.get(cache_key)
+            cached = self.semantic_cache.get(question, query_vector=query_vector, scope=cache_scope)
             if cached:
-                logger.info(f"语义缓存命中: {question[:50]}..." + (f" [分组: {group_ids}]" if group_ids else ""))
-                yield {"type": "sources", "data": cached.get("sources", [])}
-                # 模拟流式输出缓存的答案
-                answer = cached["answer"]
-                for i in range(0, len(answer), 20):
-                    yield {"type": "chunk", "data": answer[i:i+20]}
+                logger.info(f"语义缓存命中: {question[:50]}..." + (f" [分组: {group_ids}]" if group_ids else "") + (f" [用户: {user_id}]" if user_id else ""))
+                yield {"type": "sources", "data": cached.sources}
+                # 缓存答案已完整，一次性输出，无需逐段切片模拟流式
+                answer = cached.answer
+                yield {"type": "chunk", "data": answer}
                 yield {"type": "done", "data": answer}
                 return
 
@@ -381,7 +498,8 @@ class QAChatChain:
             filters=filters,
             group_ids=group_ids,
             user_id=user_id,
-            use_reranker=use_reranker
+            use_reranker=use_reranker,
+            query_vector=query_vector
         )
 
         if not results:
@@ -391,14 +509,7 @@ class QAChatChain:
             return
 
         # 先返回检索结果
-        sources = [
-            {
-                "file_path": r.get("file_path", ""),
-                "score": r.get("rerank_score", r.get("score", 0.0)),
-                "preview": r.get("content", "")[:200] + "..."
-            }
-            for r in results
-        ]
+        sources = self._build_sources(results)
         yield {"type": "sources", "data": sources}
 
         # 格式化上下文
@@ -412,21 +523,25 @@ class QAChatChain:
             # 构建消息列表（包含对话摘要处理）
             messages = self._build_messages_with_history(prompt, use_history)
 
-            # 流式生成回答
-            full_answer = ""
-            for chunk in self.llm.invoke_stream(messages):
-                full_answer += chunk
+            # 流式生成回答（合并细碎片段后下发）
+            answer_parts = []
+            for chunk in _coalesce_chunks(self.llm.invoke_stream(messages)):
+                answer_parts.append(chunk)
                 yield {"type": "chunk", "data": chunk}
+            full_answer = "".join(answer_parts)
 
             # 保存对话历史
             if use_history:
                 self.conversation_history.append({"role": "user", "content": question})
                 self.conversation_history.append({"role": "assistant", "content": full_answer})
 
-            # 存入语义缓存（使用相同的缓存键）
+            # 存入语义缓存（使用相同的缓存范围）
             if self.semantic_cache and full_answer:
                 try:
-                    self.semantic_cache.set(cache_key, full_answer, sources)
+                    self.semantic_cache.set(
+                        question, full_answer, sources,
+                        query_vector=query_vector, scope=cache_scope
+                    )
                 except Exception as cache_err:
                     logger.warning(f"语义缓存存储失败: {cache_err}")
 
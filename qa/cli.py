@@ -1,14 +1,10 @@
 """
 CLI 问答交互
-"""
-import sys
-from pathlib import Path
-
-# 添加父目录到路径
-sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from qa.chain import QAChatChain
+在项目根目录以模块方式运行: python -m qa.cli
+"""
 from utils.logger import logger
+from .chain import QAChatChain
 
 
 def main():
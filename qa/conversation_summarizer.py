@@ -20,6 +20,13 @@ MAX_HISTORY_TURNS = CONVERSATION_MAX_HISTORY_TURNS
 KEEP_RECENT_TURNS = CONVERSATION_KEEP_RECENT_TURNS
 MAX_SUMMARY_CHARS = CONVERSATION_MAX_SUMMARY_CHARS
 
+# 单条消息超过此长度时只保留首尾各一半
+MAX_MESSAGE_CHARS = 500
+_HALF_MESSAGE_CHARS = MAX_MESSAGE_CHARS // 2
+
+# 角色显示名（未知角色按助手处理）
+_ROLE_LABELS = {"user": "用户", "assistant": "助手"}
+
 
 SUMMARIZE_PROMPT = """将以下对话历史压缩为结构化摘要，便于后续对话参考。
 
@@ -48,7 +55,6 @@ class ConversationSummarizer:
             llm_client: LLM 客户端实例，若不提供则自动创建
         """
         self.llm = llm_client or get_llm_client()
-        self._summary_cache = {}  # 缓存已生成的摘要
 
     def should_summarize(self, history: List[Dict]) -> bool:
         """
@@ -68,12 +74,13 @@ class ConversationSummarizer:
         """格式化对话为文本"""
         lines = []
         for msg in messages:
-            role = "用户" if msg["role"] == "user" else "助手"
+            role = _ROLE_LABELS.get(msg["role"], "助手")
             content = msg["content"]
             # 截断过长的单条消息
-            if len(content) > 500:
-                content = content[:250] + "...[已截断]..." + content[-250:]
-            lines.append(f"{role}: {content}")
+            if len(content) > MAX_MESSAGE_CHARS:
+                lines.append(f"{role}: {content[:_HALF_MESSAGE_CHARS]}...[已截断]...{content[-_HALF_MESSAGE_CHARS:]}")
+            else:
+                lines.append(f"{role}: {content}")
         return "\n\n".join(lines)
 
     def _generate_summary(self, messages: List[Dict]) -> str:
@@ -1,17 +1,219 @@
 """
 混合检索（向量 + 关键词 + Reranker + Query改写）
 """
-from typing import List, Dict, Optional
+from typing import AbstractSet, FrozenSet, List, Dict, Optional
+import json
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+
 from retriever.vector_store import VectorStore
+from utils.cache_version import SharedCacheVersion
+from utils.ttl_cache import TTLCache
 from config import (
-    TOP_K, BASE_DIR, RERANKER_ENABLE, RERANKER_TOP_K_MULTIPLIER,
-    QUERY_REWRITE_ENABLE, QUERY_REWRITE_STRATEGY, QUERY_REWRITE_NUM_VARIANTS
+    TOP_K, BASE_DIR, KEYWORD_FAST_PATH, HYBRID_FUSION, HYBRID_RRF_K, RERANKER_ENABLE, RERANKER_TOP_K_MULTIPLIER,
+    RERANKER_MMR_ENABLE, RERANKER_MMR_LAMBDA, RERANKER_MMR_MULTIPLIER, RERANKER_MIN_CANDIDATES, RERANKER_SKIP_LITERAL,
+    QUERY_REWRITE_ENABLE, QUERY_REWRITE_STRATEGY, QUERY_REWRITE_NUM_VARIANTS,
+    SEARCH_RESULT_CACHE_SIZE, SEARCH_RESULT_CACHE_TTL
 )
 from utils.logger import logger
 
+# 检索结果预览长度（字符数）
+PREVIEW_CHARS = 200
+
+# 用户可访问知识缓存（权限变更时由管理接口递增共享版本号失效，TTL 兜底）
+USER_ACCESS_CACHE_SIZE = 1024
+USER_ACCESS_CACHE_TTL = 60  # 秒
+
+_user_access_cache = TTLCache(max_items=USER_ACCESS_CACHE_SIZE, ttl_sec=USER_ACCESS_CACHE_TTL)
+
+# 检索结果缓存（重试、多轮追问中的相同检索直接复用，权限/知识变更时随用户缓存一起失效）
+_search_result_cache = TTLCache(max_items=SEARCH_RESULT_CACHE_SIZE, ttl_sec=SEARCH_RESULT_CACHE_TTL)
+
+# 权限与检索缓存的跨 worker 版本号：缓存键带上版本号，任一进程失效时递增，
+# 其他 worker 的旧条目不再被命中（只清本进程的字典无法覆盖多 worker 部署）
+_search_cache_version = SharedCacheVersion("search")
+
+# 基础关键词索引建表只需每个进程执行一次
+_keyword_index_ready = False
+_keyword_index_lock = threading.Lock()
+
+# 关键词检索与向量检索并行执行的共享线程池（懒创建）
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_lock = threading.Lock()
+
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    """获取检索线程池（进程内共享，避免每次构造 HybridSearch 都创建线程）"""
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-search")
+    return _search_executor
+
+
+def _attach_previews(results: List[Dict]) -> List[Dict]:
+    """为最终结果生成一次内容预览，问答链各路径直接复用"""
+    for result in results:
+        content = result.get("content") or ""
+        result["preview"] = f"{content[:PREVIEW_CHARS]}..." if len(content) > PREVIEW_CHARS else content
+    return results
+
+
+def _mmr_select(results: List[Dict], k: int, lambda_: float = RERANKER_MMR_LAMBDA) -> List[Dict]:
+    """
+    MMR 多样性筛选（结果已按综合分数降序）
+
+    以归一化综合分数为相关性、文档向量余弦相似度为冗余度，选出 k 个候选，
+    去掉多查询/混合检索合并出的近重复内容，减少交叉编码器的计算量。
+    没有向量的结果（仅关键词命中）冗余度视为 0。处理后移除所有结果上的 "vector" 字段。
+    """
+    vectors = [r.pop("vector", None) for r in results]
+    n = len(results)
+    if n <= k:
+        return results
+
+    dim = next((len(v) for v in vectors if v is not None), 0)
+    if dim == 0:
+        return results[:k]
+
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None and len(vector) == dim:
+            matrix[i] = vector
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.maximum(norms, 1e-9)
+    similarity = matrix @ matrix.T
+
+    scores = np.fromiter((r.get("score", 0.0) for r in results), dtype=np.float32, count=n)
+    relevance = scores / max(float(scores.max()), 1e-9)
+
+    selected = [0]
+    max_sim = similarity[0].copy()
+    chosen = np.zeros(n, dtype=bool)
+    chosen[0] = True
+    for _ in range(k - 1):
+        mmr = lambda_ * relevance - (1 - lambda_) * max_sim
+        mmr[chosen] = -np.inf
+        pick = int(np.argmax(mmr))
+        selected.append(pick)
+        chosen[pick] = True
+        np.maximum(max_sim, similarity[pick], out=max_sim)
+
+    return [results[i] for i in selected]
+
+
+# FTS5 查询词（去掉引号、*、-、括号等会被 MATCH 语法解析的字符）
+_FTS_TERM = re.compile(r"\w+")
+
+
+def _fts_terms(query: str) -> List[str]:
+    """从用户输入中提取 FTS 查询词"""
+    return _FTS_TERM.findall(query)
+
+
+def _fts_escape(terms: List[str]) -> str:
+    """把查询词逐个加引号拼成 MATCH 表达式（隐式 AND，避免用户输入被当作 FTS 运算符）"""
+    return " ".join(f'"{term}"' for term in terms)
+
+# 字面查询：整体加引号的短语、文件名、或单个代码标识符/标签（不含中文与空白）
+_QUOTED_QUERY = re.compile(r'^\s*"[^"]+"\s*$')
+_FILENAME_QUERY = re.compile(r'^\S+\.[A-Za-z0-9]{1,5}$')
+_ASCII_TOKEN = re.compile(r'^[\x21-\x7e]{2,}$')
+# 标识符特征：下划线、点、路径分隔、::、#/@ 标签、数字、驼峰；普通英文单词（python、nginx）不算
+_IDENTIFIER_MARK = re.compile(r'[_./#@\d]|::|[a-z][A-Z]')
+
+
+def _is_literal_query(query: str) -> bool:
+    """是否为字面查找（精确文件名、标识符、标签、引号短语），此类查询关键词匹配已足够准确"""
+    query = query.strip()
+    if _QUOTED_QUERY.match(query) or _FILENAME_QUERY.match(query):
+        return True
+    return bool(_ASCII_TOKEN.match(query) and _IDENTIFIER_MARK.search(query))
+
+# BM25 参数（与 FTS5 默认一致）
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def _approx_bm25_rank(rows: List[tuple], term: str, top_k: int) -> List[Dict]:
+    """
+    对未排序的 FTS 匹配行做近似 BM25 排序（单词查询）
+
+    单个词的 IDF 对所有文档相同，排序只取决于词频和文档长度，平均长度取自本批候选。
+    分数转换与常规路径一致。
+    """
+    if not rows:
+        return []
+
+    term = term.lower()
+    lengths = [len(row["content"] or "") for row in rows]
+    avg_length = max(sum(lengths) / len(lengths), 1.0)
+
+    scored = []
+    for row, length in zip(rows, lengths):
+        tf = (row["content"] or "").lower().count(term)
+        norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg_length)
+        scored.append((tf * (_BM25_K1 + 1) / (tf + norm) if tf else 0.0, row))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [
+        {**row, "score": 1.0 / (bm25 + 1)}  # 与常规路径相同的分数转换
+        for bm25, row in scored[:top_k]
+    ]
+
+
+@dataclass(slots=True)
+class _MergeEntry:
+    """合并阶段的单条候选状态（原始结果字典只在输出时展开一次）"""
+    data: Dict
+    vector_score: float = 0.0
+    keyword_score: float = 0.0
+    query_count: int = 1
+    rrf_score: float = 0.0
+
+
+def _merge_results(
+    result_map: Dict[str, _MergeEntry],
+    results: List[Dict],
+    score_attr: str,
+    weight: float,
+    count_repeat: bool,
+    rrf_k: Optional[int] = None
+):
+    """
+    把单路检索结果合并进 result_map（同一文档取加权分数最大值）
+
+    count_repeat 为 True 时，已存在的文档再次命中会累加 query_count（多查询命中加分）。
+    指定 rrf_k 时，按名次累加 weight / (rrf_k + rank) 到 rrf_score（rank 从 1 开始）。
+    """
+    for rank, result in enumerate(results, 1):
+        result_id = result.get("id") or f"{result.get('file_path', '')}:{result.get('chunk_index', 0)}"
+        score = result.get("score", 0.0) * weight
+        entry = result_map.get(result_id)
+        if rrf_k is not None:
+            rrf = weight / (rrf_k + rank)
+        if entry is None:
+            entry = result_map[result_id] = _MergeEntry(result)
+            setattr(entry, score_attr, score)
+            if rrf_k is not None:
+                entry.rrf_score = rrf
+            continue
+        if rrf_k is not None:
+            entry.rrf_score += rrf
+        if score > getattr(entry, score_attr):
+            setattr(entry, score_attr, score)
+        if count_repeat:
+            entry.query_count += 1
+
 
 def normalize_uuid(uuid_str: str) -> str:
     """
@@ -22,12 +224,43 @@ def normalize_uuid(uuid_str: str) -> str:
     """
     if not uuid_str:
         return ""
+    # 已是标准格式（常见）时直接返回原对象，不再分配新字符串
+    if len(uuid_str) == 32 and "-" not in uuid_str and uuid_str.islower():
+        return uuid_str
+    return _normalize_uuid_slow(uuid_str)
+
+
+@lru_cache(maxsize=8192)
+def _normalize_uuid_slow(uuid_str: str) -> str:
+    """带连字符/大写的 UUID 转换（同一批 ID 会在多次查询中反复出现，结果缓存复用）"""
     return uuid_str.replace("-", "").lower()
 
 
-def get_user_accessible_qdrant_ids(user_id: int) -> set:
+@contextmanager
+def _scoped_db():
+    """
+    获取当前线程的数据库会话
+
+    一次检索中的多个权限查询（外层已打开会话时）复用同一个会话；
+    由最外层调用负责关闭，单独调用时用完即关，不会跨请求持有事务快照。
+    """
+    from admin.database import ScopedSession
+
+    owner = not ScopedSession.registry.has()
+    db = ScopedSession()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if owner:
+            ScopedSession.remove()
+
+
+def get_user_accessible_qdrant_ids(user_id: int) -> FrozenSet[str]:
     """
-    获取用户可访问的所有 qdrant_id
+    获取用户可访问的所有 qdrant_id（按用户缓存，TTL 内直接复用）
 
     规则（知识可见性由分组决定）:
     1. 用户自己创建的分组中的知识
@@ -39,66 +272,93 @@ def get_user_accessible_qdrant_ids(user_id: int) -> set:
         user_id: 当前用户ID
 
     Returns:
-        用户可访问的 qdrant_id 集合（已标准化格式）
+        用户可访问的 qdrant_id 集合（已标准化格式，只读）
     """
     if not user_id:
-        return set()
+        return frozenset()
+
+    # 键带上共享版本号：其他 worker 撤销共享或变更分组后，本进程的旧权限立即失效
+    version = _search_cache_version.get()
+    cache_key = (version, user_id)
+    if version is not None:
+        cached = _user_access_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
     try:
-        from admin.database import SessionLocal
-        from admin.models import KnowledgeEntry, GroupShare, KnowledgeGroupItem, KnowledgeGroup
+        accessible_ids = frozenset(_load_user_accessible_qdrant_ids(user_id))
+    except Exception as e:
+        # 查询失败不写缓存，下次请求重试
+        logger.error(f"获取用户可访问知识失败: {e}")
+        return frozenset()
 
-        db = SessionLocal()
-        try:
-            accessible_ids = set()
+    if version is not None:
+        _user_access_cache.set(cache_key, accessible_ids)
+    return accessible_ids
 
-            # 1. 获取用户自己创建的分组ID
-            my_group_ids = db.query(KnowledgeGroup.id).filter(
-                KnowledgeGroup.user_id == user_id
-            ).all()
-            my_group_ids = [g[0] for g in my_group_ids]
 
-            # 2. 获取公开分组ID
-            public_group_ids = db.query(KnowledgeGroup.id).filter(
-                KnowledgeGroup.is_public == True
-            ).all()
-            public_group_ids = [g[0] for g in public_group_ids]
+def invalidate_user_access_cache(user_id: Optional[int] = None):
+    """
+    使用户可访问知识缓存失效
 
-            # 3. 获取共享给当前用户的分组ID
-            shared_group_ids = db.query(GroupShare.group_id).filter(
-                GroupShare.shared_with_user_id == user_id
-            ).all()
-            shared_group_ids = [g[0] for g in shared_group_ids]
-
-            # 合并所有可访问的分组ID
-            accessible_group_ids = list(set(my_group_ids + public_group_ids + shared_group_ids))
-
-            # 4. 获取这些分组中的知识
-            if accessible_group_ids:
-                items = db.query(KnowledgeGroupItem.qdrant_id).filter(
-                    KnowledgeGroupItem.group_id.in_(accessible_group_ids)
-                ).all()
-                for item in items:
-                    if item[0]:
-                        accessible_ids.add(normalize_uuid(item[0]))
-
-            # 5. 获取用户自己创建的未分组知识
-            all_grouped_qdrant_ids = db.query(KnowledgeGroupItem.qdrant_id).distinct().all()
-            all_grouped_qdrant_ids_set = {normalize_uuid(item[0]) for item in all_grouped_qdrant_ids if item[0]}
-
-            my_ungrouped = db.query(KnowledgeEntry.qdrant_id).filter(
-                KnowledgeEntry.user_id == user_id
+    递增共享版本号，所有 worker 的用户权限缓存与检索结果缓存一并失效。
+    版本号不区分用户，user_id 仅用于兼容旧调用（传入时同样整体失效）。
+    """
+    _search_cache_version.bump()
+    # 版本号已递增，旧版本的条目不会再命中，这里只是及早释放内存（单个用户的变更也整体清空）
+    _user_access_cache.clear()
+    _search_result_cache.clear()
+
+
+def _load_user_accessible_qdrant_ids(user_id: int) -> set:
+    """从数据库查询用户可访问的 qdrant_id"""
+    from admin.models import KnowledgeEntry, GroupShare, KnowledgeGroupItem, KnowledgeGroup
+
+    with _scoped_db() as db:
+        accessible_ids = set()
+
+        # 1. 获取用户自己创建的分组ID
+        my_group_ids = db.query(KnowledgeGroup.id).filter(
+            KnowledgeGroup.user_id == user_id
+        ).all()
+        my_group_ids = [g[0] for g in my_group_ids]
+
+        # 2. 获取公开分组ID
+        public_group_ids = db.query(KnowledgeGroup.id).filter(
+            KnowledgeGroup.is_public == True
+        ).all()
+        public_group_ids = [g[0] for g in public_group_ids]
+
+        # 3. 获取共享给当前用户的分组ID
+        shared_group_ids = db.query(GroupShare.group_id).filter(
+            GroupShare.shared_with_user_id == user_id
+        ).all()
+        shared_group_ids = [g[0] for g in shared_group_ids]
+
+        # 合并所有可访问的分组ID
+        accessible_group_ids = list(set(my_group_ids + public_group_ids + shared_group_ids))
+
+        # 4. 获取这些分组中的知识
+        if accessible_group_ids:
+            items = db.query(KnowledgeGroupItem.qdrant_id).filter(
+                KnowledgeGroupItem.group_id.in_(accessible_group_ids)
             ).all()
-            for entry in my_ungrouped:
-                if entry[0] and normalize_uuid(entry[0]) not in all_grouped_qdrant_ids_set:
-                    accessible_ids.add(normalize_uuid(entry[0]))
+            for item in items:
+                if item[0]:
+                    accessible_ids.add(normalize_uuid(item[0]))
 
-            return accessible_ids
-        finally:
-            db.close()
-    except Exception as e:
-        logger.error(f"获取用户可访问知识失败: {e}")
-        return set()
+        # 5. 获取用户自己创建的未分组知识
+        all_grouped_qdrant_ids = db.query(KnowledgeGroupItem.qdrant_id).distinct().all()
+        all_grouped_qdrant_ids_set = {normalize_uuid(item[0]) for item in all_grouped_qdrant_ids if item[0]}
+
+        my_ungrouped = db.query(KnowledgeEntry.qdrant_id).filter(
+            KnowledgeEntry.user_id == user_id
+        ).all()
+        for entry in my_ungrouped:
+            if entry[0] and normalize_uuid(entry[0]) not in all_grouped_qdrant_ids_set:
+                accessible_ids.add(normalize_uuid(entry[0]))
+
+        return accessible_ids
 
 
 def get_group_qdrant_ids(group_ids: List[int]) -> List[str]:
@@ -115,33 +375,183 @@ def get_group_qdrant_ids(group_ids: List[int]) -> List[str]:
         return []
 
     try:
-        from admin.database import SessionLocal
         from admin.models import KnowledgeGroupItem
 
-        db = SessionLocal()
-        try:
+        with _scoped_db() as db:
             items = db.query(KnowledgeGroupItem.qdrant_id).filter(
                 KnowledgeGroupItem.group_id.in_(group_ids)
             ).all()
             # 标准化 UUID 格式，解决历史数据格式不一致问题
             return [normalize_uuid(item[0]) for item in items]
-        finally:
-            db.close()
     except Exception as e:
         logger.error(f"获取分组qdrant_ids失败: {e}")
         return []
 
 
+def get_intersect_qdrant_ids(group_ids: List[int], user_id: int) -> set:
+    """
+    获取指定分组中用户有权访问的 qdrant_id（分组过滤与用户权限的交集）
+
+    一次查询取出分组条目及其所属分组对用户是否可见（自己创建/公开/共享），
+    可见分组中的条目直接保留；只有不可见分组中的条目才需对照用户可访问集合
+    （同一知识可能同时属于其他可见分组）。
+
+    Args:
+        group_ids: 分组ID列表
+        user_id: 当前用户ID
+
+    Returns:
+        交集 qdrant_id 集合（已标准化格式）
+    """
+    if not group_ids or not user_id:
+        return set()
+
+    try:
+        from sqlalchemy import and_, exists, or_
+        from admin.models import GroupShare, KnowledgeGroupItem, KnowledgeGroup
+
+        with _scoped_db() as db:
+            shared = exists().where(and_(
+                GroupShare.group_id == KnowledgeGroup.id,
+                GroupShare.shared_with_user_id == user_id
+            ))
+            rows = db.query(
+                KnowledgeGroupItem.qdrant_id,
+                or_(KnowledgeGroup.user_id == user_id, KnowledgeGroup.is_public == True, shared)
+            ).join(
+                KnowledgeGroup, KnowledgeGroup.id == KnowledgeGroupItem.group_id
+            ).filter(
+                KnowledgeGroupItem.group_id.in_(group_ids)
+            ).all()
+    except Exception as e:
+        logger.error(f"获取分组与用户权限交集失败: {e}")
+        return set()
+
+    allowed_ids = set()
+    pending = []
+    for qdrant_id, group_visible in rows:
+        if not qdrant_id:
+            continue
+        if group_visible:
+            allowed_ids.add(normalize_uuid(qdrant_id))
+        else:
+            pending.append(normalize_uuid(qdrant_id))
+
+    if pending:
+        user_accessible_ids = get_user_accessible_qdrant_ids(user_id)
+        allowed_ids.update(qid for qid in pending if qid in user_accessible_ids)
+
+    return allowed_ids
+
+
+def _resolve_allowed_ids(group_ids: Optional[List[int]], user_id: Optional[int]) -> AbstractSet[str]:
+    """
+    计算本次检索允许访问的 qdrant_id 范围（分组过滤与用户权限）
+
+    各项权限查询在同一个数据库会话中完成。返回空集合表示没有可检索的知识。
+    """
+    try:
+        with _scoped_db():
+            if group_ids and user_id:
+                # 交集直接在数据库侧计算
+                allowed_ids = get_intersect_qdrant_ids(group_ids, user_id)
+                if not allowed_ids:
+                    logger.warning(f"分组 {group_ids} 与用户 {user_id} 权限交集为空")
+                else:
+                    logger.info(f"分组+用户权限过滤: 限制在 {len(allowed_ids)} 个知识条目内检索")
+            elif group_ids:
+                allowed_ids = set(get_group_qdrant_ids(group_ids))
+                if not allowed_ids:
+                    logger.warning(f"分组 {group_ids} 中没有知识条目")
+                else:
+                    logger.info(f"分组过滤: 限制在 {len(allowed_ids)} 个知识条目内检索")
+            else:
+                allowed_ids = get_user_accessible_qdrant_ids(user_id)
+                if not allowed_ids:
+                    logger.warning(f"用户 {user_id} 没有可访问的知识条目")
+                else:
+                    logger.info(f"用户权限过滤: 限制在 {len(allowed_ids)} 个知识条目内检索")
+            return allowed_ids
+    except Exception as e:
+        logger.error(f"解析检索权限范围失败: {e}")
+        return set()
+
+
 class HybridSearch:
     """混合检索器（支持 Reranker 重排 + Query 改写 + 高级关键词索引）"""
 
+    # 基础 FTS5 检索语句（文本固定，连接复用时命中 sqlite3 语句缓存，免去重复解析）
+    # 以 FTS 表名 MATCH 并由 FTS5 按 rank（默认即 bm25）输出有序结果，无需额外排序
+    _FTS_SEARCH_SQL = """
+        SELECT
+            ki.id,
+            ki.content,
+            ki.file_path,
+            ki.type,
+            ki.metadata,
+            bm25(keyword_index_fts) AS score
+        FROM keyword_index_fts
+        JOIN keyword_index ki ON ki.rowid = keyword_index_fts.rowid
+        WHERE keyword_index_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """
+
+    # 带权限范围的版本：ID 列表以 JSON 传入，避免 SQLite 参数个数限制
+    _FTS_SEARCH_IN_IDS_SQL = """
+        SELECT
+            ki.id,
+            ki.content,
+            ki.file_path,
+            ki.type,
+            ki.metadata,
+            bm25(keyword_index_fts) AS score
+        FROM keyword_index_fts
+        JOIN keyword_index ki ON ki.rowid = keyword_index_fts.rowid
+        WHERE keyword_index_fts MATCH ?
+          AND replace(lower(ki.id), '-', '') IN (SELECT value FROM json_each(?))
+        ORDER BY rank
+        LIMIT ?
+    """
+
+    # 快速路径：不按 rank 排序，只取少量匹配行（由 _approx_bm25_rank 在本地排序）
+    _FTS_SCAN_SQL = """
+        SELECT
+            ki.id,
+            ki.content,
+            ki.file_path,
+            ki.type,
+            ki.metadata
+        FROM keyword_index_fts
+        JOIN keyword_index ki ON ki.rowid = keyword_index_fts.rowid
+        WHERE keyword_index_fts MATCH ?
+        LIMIT ?
+    """
+
+    _FTS_SCAN_IN_IDS_SQL = """
+        SELECT
+            ki.id,
+            ki.content,
+            ki.file_path,
+            ki.type,
+            ki.metadata
+        FROM keyword_index_fts
+        JOIN keyword_index ki ON ki.rowid = keyword_index_fts.rowid
+        WHERE keyword_index_fts MATCH ?
+          AND replace(lower(ki.id), '-', '') IN (SELECT value FROM json_each(?))
+        LIMIT ?
+    """
+
     def __init__(self):
         self.vector_store = VectorStore()
         self.db_path = BASE_DIR / "rag.db"
+        self._tls = threading.local()  # 每个线程复用一个 SQLite 连接
         self._reranker = None
         self._query_rewriter = None
         self._keyword_index_manager = None  # 新增：高级关键词索引管理器
         self._init_keyword_index()
+        # 启动时即加载，顺带在后台预热 jieba 词典
+        self._get_keyword_index_manager()
 
     def _get_keyword_index_manager(self):
         """懒加载关键词索引管理器"""
@@ -171,96 +581,117 @@ class HybridSearch:
             )
         return self._query_rewriter
 
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的 SQLite 连接（首次使用时创建并设置 PRAGMA）"""
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-64000")
+            conn.row_factory = sqlite3.Row
+            self._tls.conn = conn
+        return conn
+
     def _init_keyword_index(self):
-        """初始化关键词索引数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # 创建表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS keyword_index (
-                id TEXT PRIMARY KEY,
-                content TEXT,
-                file_path TEXT,
-                type TEXT,
-                metadata TEXT
-            )
-        """)
-
-        cursor.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS keyword_index_fts USING fts5(
-                content,
-                file_path,
-                type,
-                content='keyword_index',
-                content_rowid='rowid'
-            )
-        """)
+        """初始化关键词索引数据库（每个进程只执行一次建表）"""
+        global _keyword_index_ready
+        if _keyword_index_ready:
+            return
+
+        with _keyword_index_lock:
+            if _keyword_index_ready:
+                return
+
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            # 创建表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS keyword_index (
+                    id TEXT PRIMARY KEY,
+                    content TEXT,
+                    file_path TEXT,
+                    type TEXT,
+                    metadata TEXT
+                )
+            """)
 
-        conn.commit()
-        conn.close()
-        logger.info("关键词索引数据库初始化完成")
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS keyword_index_fts USING fts5(
+                    content,
+                    file_path,
+                    type,
+                    content='keyword_index',
+                    content_rowid='rowid'
+                )
+            """)
+
+            conn.commit()
+            conn.close()
+            _keyword_index_ready = True
+            logger.info("关键词索引数据库初始化完成")
+
+    def _keyword_search(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        allowed_ids: Optional[AbstractSet[str]] = None
+    ) -> List[Dict]:
+        """关键词检索（优先使用高级索引管理器），allowed_ids 非空时在 SQL 中过滤权限范围"""
+        allowed_ids_json = json.dumps(list(allowed_ids)) if allowed_ids is not None else None
 
-    def _keyword_search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
-        """关键词检索（优先使用高级索引管理器）"""
         # 尝试使用高级关键词索引管理器
         keyword_manager = self._get_keyword_index_manager()
         if keyword_manager:
             try:
-                results = keyword_manager.search(query, limit=top_k)
+                results = keyword_manager.search(query, limit=top_k, allowed_ids_json=allowed_ids_json)
                 # 转换结果格式
-                converted_results = []
-                for r in results:
-                    converted_results.append({
+                return [
+                    {
                         "id": r.get("doc_id") or r.get("qdrant_id"),
                         "content": r.get("content", ""),
                         "file_path": r.get("file_path", ""),
                         "type": r.get("category", "general"),
                         "score": abs(r.get("score", 0.0))  # BM25 分数转换
-                    })
-                return converted_results
+                    }
+                    for r in results
+                ]
             except Exception as e:
                 logger.warning(f"高级关键词检索失败，回退到基础检索: {e}")
 
         # 回退到基础关键词检索
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        terms = _fts_terms(query)
+        if not terms:
+            return []
+        match_query = _fts_escape(terms)
 
         try:
+            # 单词查询：跳过 FTS5 全量 rank 计算，取 4 倍候选在本地近似排序
+            if KEYWORD_FAST_PATH and len(terms) == 1:
+                if allowed_ids_json is None:
+                    cursor = self._conn().execute(self._FTS_SCAN_SQL, (match_query, top_k * 4))
+                else:
+                    cursor = self._conn().execute(self._FTS_SCAN_IN_IDS_SQL, (match_query, allowed_ids_json, top_k * 4))
+                return _approx_bm25_rank(cursor.fetchall(), terms[0], top_k)
+
             # FTS5 搜索
-            cursor.execute("""
-                SELECT
-                    ki.id,
-                    ki.content,
-                    ki.file_path,
-                    ki.type,
-                    ki.metadata,
-                    rank
-                FROM keyword_index_fts kf
-                JOIN keyword_index ki ON kf.rowid = ki.rowid
-                WHERE keyword_index_fts MATCH ?
-                ORDER BY rank
-                LIMIT ?
-            """, (query, top_k))
-
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    "id": row[0],
-                    "content": row[1],
-                    "file_path": row[2],
-                    "type": row[3],
-                    "metadata": row[4],
-                    "score": 1.0 / (abs(row[5]) + 1)  # 简单的分数转换
-                })
-
-            return results
+            if allowed_ids_json is None:
+                cursor = self._conn().execute(self._FTS_SEARCH_SQL, (match_query, top_k))
+            else:
+                cursor = self._conn().execute(self._FTS_SEARCH_IN_IDS_SQL, (match_query, allowed_ids_json, top_k))
+
+            # 直接迭代游标构造结果，不先 fetchall 出整份行列表
+            return [
+                {**row, "score": 1.0 / (abs(row["score"]) + 1)}  # 简单的分数转换
+                for row in cursor
+            ]
 
         except Exception as e:
             logger.error(f"关键词检索失败: {e}")
             return []
-        finally:
-            conn.close()
 
     def search(
         self,
@@ -274,6 +705,8 @@ class HybridSearch:
         keyword_weight: float = 0.3,
         use_reranker: bool = None,
         use_query_rewrite: bool = None,
+        query_vector: Optional[np.ndarray] = None,
+        fusion: Optional[str] = None,
     ) -> List[Dict]:
         """
         混合检索（可选 Reranker 重排 + Query 改写 + 用户权限过滤）
@@ -289,42 +722,67 @@ class HybridSearch:
             keyword_weight: 关键词检索权重
             use_reranker: 是否使用 Reranker（None 时使用配置默认值）
             use_query_rewrite: 是否使用 Query 改写（None 时使用配置默认值）
+            query_vector: 原始查询的预计算向量（改写变体另行批量嵌入）
+            fusion: 融合方式 "weighted" / "rrf"（None 时使用配置默认值）
 
         Returns:
             检索结果列表
         """
-        # 处理分组过滤
-        allowed_qdrant_ids = None
-        if group_ids:
-            allowed_qdrant_ids = set(get_group_qdrant_ids(group_ids))
-            if not allowed_qdrant_ids:
-                logger.warning(f"分组 {group_ids} 中没有知识条目")
-                return []
-            logger.info(f"分组过滤: 限制在 {len(allowed_qdrant_ids)} 个知识条目内检索")
-
-        # 处理用户权限过滤（多用户知识隔离）
-        if user_id:
-            user_accessible_ids = get_user_accessible_qdrant_ids(user_id)
-            if not user_accessible_ids:
-                logger.warning(f"用户 {user_id} 没有可访问的知识条目")
-                return []
-            # 与分组过滤取交集
-            if allowed_qdrant_ids:
-                allowed_qdrant_ids = allowed_qdrant_ids & user_accessible_ids
-                if not allowed_qdrant_ids:
-                    logger.warning(f"分组和用户权限交集为空")
-                    return []
-            else:
-                allowed_qdrant_ids = user_accessible_ids
-            logger.info(f"用户权限过滤: 限制在 {len(allowed_qdrant_ids)} 个知识条目内检索")
-
-        # 确定是否使用 Reranker
+        # 确定是否使用 Reranker / Query 改写 / 融合方式（先解析默认值，保证缓存键一致）
         if use_reranker is None:
             use_reranker = RERANKER_ENABLE
-
-        # 确定是否使用 Query 改写
         if use_query_rewrite is None:
             use_query_rewrite = QUERY_REWRITE_ENABLE
+        fusion = fusion or HYBRID_FUSION
+
+        cache_key = None
+        # 版本号读取失败时不走缓存，宁可多检索一次也不返回可能已失效的结果
+        version = _search_cache_version.get() if SEARCH_RESULT_CACHE_TTL > 0 else None
+        if version is not None:
+            cache_key = (
+                version, query, top_k, json.dumps(filters, sort_keys=True, default=str) if filters else None,
+                tuple(sorted(group_ids)) if group_ids else None, user_id, use_hybrid,
+                vector_weight, keyword_weight, use_reranker, use_query_rewrite, fusion
+            )
+            cached = _search_result_cache.get(cache_key)
+            if cached is not None:
+                # 返回副本，调用方修改结果不影响缓存
+                return [dict(r) for r in cached]
+
+        results = self._search(
+            query, top_k, filters, group_ids, user_id, use_hybrid, vector_weight, keyword_weight,
+            use_reranker, use_query_rewrite, query_vector, fusion
+        )
+        # 空结果可能来自权限解析失败等临时错误，不缓存
+        if cache_key is not None and results:
+            _search_result_cache.set(cache_key, [dict(r) for r in results])
+        return results
+
+    def _search(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict],
+        group_ids: Optional[List[int]],
+        user_id: Optional[int],
+        use_hybrid: bool,
+        vector_weight: float,
+        keyword_weight: float,
+        use_reranker: bool,
+        use_query_rewrite: bool,
+        query_vector: Optional[np.ndarray],
+        fusion: str,
+    ) -> List[Dict]:
+        """混合检索主流程（参数默认值已由 search 解析）"""
+        # 处理分组过滤与用户权限过滤（多用户知识隔离）
+        allowed_qdrant_ids = None
+        if group_ids or user_id:
+            allowed_qdrant_ids = _resolve_allowed_ids(group_ids, user_id)
+            if not allowed_qdrant_ids:
+                return []
+
+        # 倒数排名融合：各路结果按名次计分，不依赖 BM25 与余弦分数的量纲
+        rrf_k = HYBRID_RRF_K if fusion == "rrf" else None
 
         # Query 改写
         queries = [query]
@@ -337,83 +795,144 @@ class HybridSearch:
         # 计算候选数量（Reranker 需要更多候选）
         candidate_k = top_k * RERANKER_TOP_K_MULTIPLIER if use_reranker else top_k
 
-        # 多查询检索
-        result_map = {}
+        # 重排前做 MMR 去重时需要候选的文档向量
+        use_mmr = use_reranker and RERANKER_MMR_ENABLE
 
-        for q in queries:
-            if not use_hybrid:
-                # 仅使用向量检索
-                q_results = self.vector_store.search(q, candidate_k, filters)
-            else:
-                # 向量检索
-                vector_results = self.vector_store.search(q, candidate_k, filters)
-
-                # 关键词检索
-                keyword_results = self._keyword_search(q, candidate_k)
-
-                # 合并当前查询的结果
-                q_results = []
-
-                # 添加向量检索结果
-                for result in vector_results:
-                    result_id = result.get("id") or result.get("file_path", "") + ":" + str(result.get("chunk_index", 0))
-                    if result_id not in result_map:
-                        result_map[result_id] = {
-                            **result,
-                            "vector_score": result.get("score", 0.0) * vector_weight,
-                            "keyword_score": 0.0,
-                            "query_count": 1
-                        }
-                    else:
-                        result_map[result_id]["vector_score"] = max(
-                            result_map[result_id].get("vector_score", 0),
-                            result.get("score", 0.0) * vector_weight
-                        )
-                        result_map[result_id]["query_count"] = result_map[result_id].get("query_count", 0) + 1
-
-                # 添加关键词检索结果
-                for result in keyword_results:
-                    result_id = result.get("id")
-                    if result_id in result_map:
-                        result_map[result_id]["keyword_score"] = max(
-                            result_map[result_id].get("keyword_score", 0),
-                            result.get("score", 0.0) * keyword_weight
-                        )
-                    else:
-                        result_map[result_id] = {
-                            **result,
-                            "vector_score": 0.0,
-                            "keyword_score": result.get("score", 0.0) * keyword_weight,
-                            "query_count": 1
-                        }
-
-        # 计算综合分数并排序
-        results = []
-        for result_id, result in result_map.items():
-            # 分组过滤：如果指定了分组，只保留分组内的结果
-            if allowed_qdrant_ids:
+        # 单路向量检索（无权限范围、无改写、非混合）：Qdrant 结果已按分数排序，跳过合并与打分
+        if not use_hybrid and len(queries) == 1 and allowed_qdrant_ids is None:
+            results = self.vector_store.search(
+                query, candidate_k, filters, query_vector=query_vector, with_vectors=use_mmr
+            )
+            for rank, result in enumerate(results, 1):
+                result["vector_score"] = result["score"] = result.get("score", 0.0) * vector_weight
+                result["keyword_score"] = 0.0
+                result["query_count"] = 1
+                if rrf_k is not None:
+                    result["score"] = vector_weight / (rrf_k + rank)
+            return self._finalize_results(query, results, top_k, use_reranker, use_mmr)
+
+        # 查询向量：原始查询复用调用方已计算的向量，其余改写变体一次批量嵌入
+        query_vectors = {}
+        if query_vector is not None:
+            query_vectors[query] = query_vector
+        pending = [q for q in dict.fromkeys(queries) if q not in query_vectors]
+        if len(pending) > 1:
+            try:
+                query_vectors.update(zip(pending, self.vector_store.embed_batch(pending)))
+            except Exception as e:
+                logger.warning(f"批量嵌入查询失败，逐条嵌入: {e}")
+
+        # 多查询检索：各改写变体的检索互不依赖，关键词检索（本地 SQLite，权限范围在 SQL 中过滤）
+        # 与其余变体的向量检索放到线程池，原始查询的向量检索在当前线程执行
+        executor = _get_search_executor()
+        keyword_futures = []
+        if use_hybrid:
+            keyword_futures = [
+                executor.submit(self._keyword_search, q, candidate_k, allowed_qdrant_ids) for q in queries
+            ]
+
+        def vector_search(q: str) -> List[Dict]:
+            # 向量检索（Qdrant RPC，权限范围在 Qdrant 端过滤）
+            return self.vector_store.search(
+                q, candidate_k, filters, query_vector=query_vectors.get(q), allowed_ids=allowed_qdrant_ids,
+                with_vectors=use_mmr
+            )
+
+        vector_futures = [executor.submit(vector_search, q) for q in queries[1:]]
+        vector_results_list = [vector_search(queries[0])] + [future.result() for future in vector_futures]
+
+        # 按查询顺序合并，结果与逐条检索一致
+        result_map: Dict[str, _MergeEntry] = {}
+        for i, vector_results in enumerate(vector_results_list):
+            _merge_results(result_map, vector_results, "vector_score", vector_weight, count_repeat=True, rrf_k=rrf_k)
+            if keyword_futures:
+                _merge_results(
+                    result_map, keyword_futures[i].result(), "keyword_score", keyword_weight,
+                    count_repeat=False, rrf_k=rrf_k
+                )
+
+        # 分组/权限过滤：如果指定了分组或用户，只保留可访问的结果
+        # （两路检索已在 Qdrant/SQL 中按范围过滤，这里作为兜底校验）
+        if allowed_qdrant_ids:
+            candidates = [
+                entry for result_id, entry in result_map.items()
                 # result_id 可能是 qdrant_id 或 file_path:chunk_index 格式
-                qdrant_id = result.get("id") or result_id.split(":")[0] if ":" in result_id else result_id
                 # 标准化 UUID 格式后再比较，解决历史数据格式不一致问题
-                if normalize_uuid(qdrant_id) not in allowed_qdrant_ids:
-                    continue
-
-            # 多查询命中加分
-            query_boost = 1.0 + (result.get("query_count", 1) - 1) * 0.1
-            combined_score = (result.get("vector_score", 0.0) + result.get("keyword_score", 0.0)) * query_boost
-            result["score"] = combined_score
-            results.append(result)
-
-        # 按分数排序
-        results.sort(key=lambda x: x["score"], reverse=True)
-
-        # Reranker 重排
+                if normalize_uuid(
+                    entry.data.get("id") or result_id.split(":")[0] if ":" in result_id else result_id
+                ) in allowed_qdrant_ids
+            ]
+        else:
+            candidates = list(result_map.values())
+
+        # 计算综合分数并排序（多查询命中加分），向量化计算
+        n = len(candidates)
+        if rrf_k is not None:
+            # RRF 分数已在合并时按各路名次累加，多查询命中自然得分更高
+            scores = np.fromiter((e.rrf_score for e in candidates), dtype=np.float64, count=n)
+        else:
+            vector_scores = np.fromiter((e.vector_score for e in candidates), dtype=np.float64, count=n)
+            keyword_scores = np.fromiter((e.keyword_score for e in candidates), dtype=np.float64, count=n)
+            query_counts = np.fromiter((e.query_count for e in candidates), dtype=np.float64, count=n)
+            scores = (vector_scores + keyword_scores) * (1.0 + (query_counts - 1) * 0.1)
+
+        # Reranker 需要全部候选（按分数排序），否则只需选出 top_k
+        limit = n if use_reranker else min(top_k, n)
+        if limit < n:
+            top_idx = np.argpartition(-scores, limit - 1)[:limit]
+            order = top_idx[np.argsort(-scores[top_idx], kind="stable")]
+        else:
+            order = np.argsort(-scores, kind="stable")
+
+        # 只为选中的候选生成输出字典
+        results = []
+        for i in order.tolist():
+            entry = candidates[i]
+            results.append({
+                **entry.data,
+                "vector_score": entry.vector_score,
+                "keyword_score": entry.keyword_score,
+                "query_count": entry.query_count,
+                "score": float(scores[i])
+            })
+
+        return self._finalize_results(query, results, top_k, use_reranker, use_mmr)
+
+    def _finalize_results(
+        self,
+        query: str,
+        results: List[Dict],
+        top_k: int,
+        use_reranker: bool,
+        use_mmr: bool
+    ) -> List[Dict]:
+        """对已按分数排序的候选做可选的 MMR + Reranker 重排，截取 top_k 并生成预览"""
+        # 候选不超过 top_k 时重排不会改变返回集合；少于配置下限时也不值得一次前向计算
+        if use_reranker and (len(results) <= top_k or len(results) < RERANKER_MIN_CANDIDATES):
+            logger.debug(f"候选数 {len(results)} 过少，跳过 Reranker")
+            use_reranker = False
+            for result in results:
+                result.pop("vector", None)
+
+        # 字面查询且排名第一的候选有关键词命中：关键词匹配已给出精确结果，不做交叉编码
+        if (
+            use_reranker and RERANKER_SKIP_LITERAL and results
+            and results[0].get("keyword_score", 0.0) > 0 and _is_literal_query(query)
+        ):
+            logger.debug(f"字面查询 {query!r} 已有关键词命中，跳过 Reranker")
+            use_reranker = False
+            for result in results:
+                result.pop("vector", None)
+
+        # Reranker 重排（先 MMR 去重，减少交叉编码的候选数）
         if use_reranker:
+            if use_mmr:
+                results = _mmr_select(results, top_k * RERANKER_MMR_MULTIPLIER)
             reranker = self._get_reranker()
             if reranker:
                 logger.info(f"使用 Reranker 对 {len(results)} 个候选进行重排")
                 results = reranker.rerank(query, results, top_k)
-                return results
+                return _attach_previews(results)
 
         # 返回 top_k
-        return results[:top_k]
+        return _attach_previews(results[:top_k])
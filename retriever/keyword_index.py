@@ -3,15 +3,71 @@
 使用 SQLite FTS5 实现高效的全文检索
 """
 
+import json
 import sqlite3
 import os
 import re
+import threading
 import jieba
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
+from config import (
+    PREPROCESS_CACHE_SIZE, JIEBA_PRELOAD, KEYWORD_TOKENIZE_WORKERS, KEYWORD_TOKENIZE_MIN_BATCH
+)
 from utils.logger import logger
 
+# 中文字符检测
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+# 批量建索引的分词进程池（懒创建）
+_tokenize_pool: Optional[ProcessPoolExecutor] = None
+_tokenize_pool_lock = threading.Lock()
+
+_jieba_preload_started = False
+_jieba_preload_lock = threading.Lock()
+
+
+def preload_jieba():
+    """在后台线程加载 jieba 词典（每个进程只触发一次）"""
+    global _jieba_preload_started
+    if not JIEBA_PRELOAD or _jieba_preload_started:
+        return
+    with _jieba_preload_lock:
+        if _jieba_preload_started:
+            return
+        _jieba_preload_started = True
+    threading.Thread(target=jieba.initialize, daemon=True, name="jieba-preload").start()
+
+
+@lru_cache(maxsize=PREPROCESS_CACHE_SIZE)
+def _tokenize_chinese_cached(text: str) -> str:
+    """jieba 分词（按原文缓存，结果为空格分隔的词串）"""
+    return " ".join(jieba.cut(text, cut_all=False))
+
+
+@lru_cache(maxsize=PREPROCESS_CACHE_SIZE)
+def _preprocess_cached(content: str) -> str:
+    """索引/查询文本预处理（按原文缓存）"""
+    # 检测是否包含中文
+    if _CJK_RE.search(content) is not None:
+        # 中文内容进行分词（不经过 _tokenize_chinese_cached，避免同一结果缓存两份）
+        return " ".join(jieba.cut(content, cut_all=False))
+    # 英文内容直接返回（FTS5 会自动处理）
+    return content
+
+
+def _get_tokenize_pool() -> ProcessPoolExecutor:
+    """获取分词进程池（进程内共享）"""
+    global _tokenize_pool
+    if _tokenize_pool is None:
+        with _tokenize_pool_lock:
+            if _tokenize_pool is None:
+                _tokenize_pool = ProcessPoolExecutor(max_workers=KEYWORD_TOKENIZE_WORKERS)
+    return _tokenize_pool
+
 
 class KeywordIndexManager:
     """关键词索引管理器 - 基于 SQLite FTS5"""
@@ -31,12 +87,29 @@ class KeywordIndexManager:
             db_path = str(data_dir / "keyword_index.db")
 
         self.db_path = db_path
+        self._local = threading.local()  # 每个线程复用一个 SQLite 连接
+        self._write_lock = threading.Lock()  # FTS5 写入本身串行，加锁避免 database is locked
         self._init_database()
+        preload_jieba()
         logger.info(f"关键词索引管理器初始化完成: {db_path}")
 
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的 SQLite 连接（首次使用时创建并设置 PRAGMA）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
     def _init_database(self):
         """初始化数据库和 FTS5 表"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn()
         cursor = conn.cursor()
 
         # 创建 FTS5 虚拟表用于全文检索
@@ -75,9 +148,12 @@ class KeywordIndexManager:
             CREATE INDEX IF NOT EXISTS idx_metadata_file_path
             ON doc_metadata(file_path)
         """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_metadata_category
+            ON doc_metadata(category)
+        """)
 
         conn.commit()
-        conn.close()
 
     def _tokenize_chinese(self, text: str) -> str:
         """
@@ -89,9 +165,7 @@ class KeywordIndexManager:
         Returns:
             分词后的文本（空格分隔）
         """
-        # 使用 jieba 分词
-        words = jieba.cut(text, cut_all=False)
-        return " ".join(words)
+        return _tokenize_chinese_cached(text)
 
     def _preprocess_content(self, content: str) -> str:
         """
@@ -105,16 +179,21 @@ class KeywordIndexManager:
         """
         if not content:
             return ""
+        return _preprocess_cached(content)
 
-        # 检测是否包含中文
-        has_chinese = bool(re.search(r'[\u4e00-\u9fff]', content))
+    def _preprocess_many(self, texts: List[str]) -> List[str]:
+        """
+        批量预处理文本
 
-        if has_chinese:
-            # 中文内容进行分词
-            return self._tokenize_chinese(content)
-        else:
-            # 英文内容直接返回（FTS5 会自动处理）
-            return content
+        开启 KEYWORD_TOKENIZE_WORKERS 且批量足够大时，jieba 分词分发到进程池并行执行
+        （每个子进程首次使用需加载一次词典，小批量直接在当前进程处理）。
+        """
+        if KEYWORD_TOKENIZE_WORKERS > 0 and len(texts) >= KEYWORD_TOKENIZE_MIN_BATCH:
+            try:
+                return list(_get_tokenize_pool().map(_preprocess_cached, texts, chunksize=32))
+            except Exception as e:
+                logger.warning(f"并行分词失败，改为当前进程分词: {e}")
+        return [self._preprocess_content(text) for text in texts]
 
     def add_document(
         self,
@@ -142,31 +221,29 @@ class KeywordIndexManager:
             是否添加成功
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # 预处理内容
             processed_content = self._preprocess_content(content)
             processed_title = self._preprocess_content(title)
 
-            # 先删除已存在的文档（更新场景）
-            cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
-            cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
+            conn = self._conn()
+            with self._write_lock, conn:
+                cursor = conn.cursor()
 
-            # 插入 FTS5 索引
-            cursor.execute("""
-                INSERT INTO keyword_index (doc_id, content, title, category, file_path)
-                VALUES (?, ?, ?, ?, ?)
-            """, (doc_id, processed_content, processed_title, category, file_path))
+                # 先删除已存在的索引（更新场景，FTS5 不支持 OR REPLACE）
+                cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
 
-            # 插入元数据
-            cursor.execute("""
-                INSERT INTO doc_metadata (doc_id, qdrant_id, file_path, title, category, chunk_index)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (doc_id, qdrant_id or doc_id, file_path, title, category, chunk_index))
+                # 插入 FTS5 索引
+                cursor.execute("""
+                    INSERT INTO keyword_index (doc_id, content, title, category, file_path)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (doc_id, processed_content, processed_title, category, file_path))
+
+                # 插入或覆盖元数据（doc_id 为主键）
+                cursor.execute("""
+                    INSERT OR REPLACE INTO doc_metadata (doc_id, qdrant_id, file_path, title, category, chunk_index)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (doc_id, qdrant_id or doc_id, file_path, title, category, chunk_index))
 
-            conn.commit()
-            conn.close()
             return True
 
         except Exception as e:
@@ -186,53 +263,61 @@ class KeywordIndexManager:
         if not documents:
             return 0
 
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            success_count = 0
+        # 同一批次内 doc_id 重复时以最后一条为准（与逐条覆盖写入的结果一致）
+        docs_by_id: Dict[str, Dict[str, Any]] = {}
+        for doc in documents:
+            doc_id = doc.get("doc_id") or doc.get("id")
+            if doc_id:
+                docs_by_id[doc_id] = doc
 
-            for doc in documents:
-                try:
-                    doc_id = doc.get("doc_id") or doc.get("id")
-                    content = doc.get("content", "")
-                    title = doc.get("title", "")
-                    category = doc.get("category", "general")
-                    file_path = doc.get("file_path", "")
-                    qdrant_id = doc.get("qdrant_id", doc_id)
-                    chunk_index = doc.get("chunk_index", 0)
-
-                    if not doc_id:
-                        continue
-
-                    # 预处理内容
-                    processed_content = self._preprocess_content(content)
-                    processed_title = self._preprocess_content(title)
-
-                    # 删除已存在的
-                    cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
-                    cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
-
-                    # 插入 FTS5 索引
-                    cursor.execute("""
-                        INSERT INTO keyword_index (doc_id, content, title, category, file_path)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (doc_id, processed_content, processed_title, category, file_path))
-
-                    # 插入元数据
-                    cursor.execute("""
-                        INSERT INTO doc_metadata (doc_id, qdrant_id, file_path, title, category, chunk_index)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (doc_id, qdrant_id, file_path, title, category, chunk_index))
-
-                    success_count += 1
-
-                except Exception as e:
-                    logger.warning(f"添加文档 {doc.get('doc_id')} 失败: {e}")
-                    continue
-
-            conn.commit()
-            conn.close()
+        try:
+            # 分词放在事务外，避免持有写锁期间做 CPU 密集的预处理
+            docs = list(docs_by_id.values())
+            contents = self._preprocess_many([doc.get("content") or "" for doc in docs])
+            titles = self._preprocess_many([doc.get("title") or "" for doc in docs])
+
+            fts_rows = []
+            meta_rows = []
+            for (doc_id, doc), content, processed_title in zip(docs_by_id.items(), contents, titles):
+                title = doc.get("title", "")
+                category = doc.get("category", "general")
+                file_path = doc.get("file_path", "")
+                fts_rows.append((doc_id, content, processed_title, category, file_path))
+                meta_rows.append((
+                    doc_id,
+                    doc.get("qdrant_id", doc_id),
+                    file_path,
+                    title,
+                    category,
+                    doc.get("chunk_index", 0)
+                ))
+            doc_ids_json = json.dumps(list(docs_by_id))
+
+            conn = self._conn()
+            with self._write_lock, conn:
+                # 整批一个写事务，只提交一次
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+
+                # 删除已存在的索引（FTS5 的 doc_id 无索引，一条语句只扫描一遍全表）
+                cursor.execute(
+                    "DELETE FROM keyword_index WHERE doc_id IN (SELECT value FROM json_each(?))",
+                    (doc_ids_json,)
+                )
+
+                # 插入 FTS5 索引
+                cursor.executemany("""
+                    INSERT INTO keyword_index (doc_id, content, title, category, file_path)
+                    VALUES (?, ?, ?, ?, ?)
+                """, fts_rows)
+
+                # 插入或覆盖元数据（doc_id 为主键）
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO doc_metadata (doc_id, qdrant_id, file_path, title, category, chunk_index)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, meta_rows)
+
+            success_count = len(fts_rows)
 
             logger.info(f"批量添加关键词索引完成: {success_count}/{len(documents)}")
             return success_count
@@ -245,7 +330,8 @@ class KeywordIndexManager:
         self,
         query: str,
         limit: int = 10,
-        category: str = None
+        category: str = None,
+        allowed_ids_json: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         关键词检索
@@ -254,66 +340,57 @@ class KeywordIndexManager:
             query: 查询文本
             limit: 返回结果数量
             category: 可选的分类过滤
+            allowed_ids_json: 可选的权限范围，标准化 ID 列表的 JSON 字符串
 
         Returns:
             匹配的文档列表，包含 doc_id, score, title, file_path 等
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._conn().cursor()
 
-            # 预处理查询
-            processed_query = self._preprocess_content(query)
+            # 预处理查询（分词后逐词加引号，避免标点被当作 FTS5 运算符导致语法错误）
+            terms = re.findall(r"\w+", self._preprocess_content(query))
+            if not terms:
+                return []
+            processed_query = " ".join(f'"{term}"' for term in terms)
 
             # 构建 FTS5 查询
-            # 使用 BM25 评分
+            # 使用 BM25 评分（rank 列即默认 bm25，按 rank 排序由 FTS5 直接给出有序结果）
+            conditions = ["keyword_index MATCH ?"]
+            params: List[Any] = [processed_query]
             if category:
-                cursor.execute("""
-                    SELECT
-                        k.doc_id,
-                        bm25(keyword_index) as score,
-                        k.title,
-                        k.file_path,
-                        k.category,
-                        m.qdrant_id,
-                        m.chunk_index
-                    FROM keyword_index k
-                    LEFT JOIN doc_metadata m ON k.doc_id = m.doc_id
-                    WHERE keyword_index MATCH ? AND k.category = ?
-                    ORDER BY score
-                    LIMIT ?
-                """, (processed_query, category, limit))
-            else:
-                cursor.execute("""
-                    SELECT
-                        k.doc_id,
-                        bm25(keyword_index) as score,
-                        k.title,
-                        k.file_path,
-                        k.category,
-                        m.qdrant_id,
-                        m.chunk_index
-                    FROM keyword_index k
-                    LEFT JOIN doc_metadata m ON k.doc_id = m.doc_id
-                    WHERE keyword_index MATCH ?
-                    ORDER BY score
-                    LIMIT ?
-                """, (processed_query, limit))
-
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    "doc_id": row[0],
-                    "score": abs(row[1]),  # BM25 返回负分，取绝对值
-                    "title": row[2],
-                    "file_path": row[3],
-                    "category": row[4],
-                    "qdrant_id": row[5],
-                    "chunk_index": row[6]
-                })
-
-            conn.close()
-            return results
+                conditions.append("k.category = ?")
+                params.append(category)
+            if allowed_ids_json is not None:
+                # 与检索侧一致：优先 doc_id，其次 qdrant_id
+                conditions.append(
+                    "replace(lower(COALESCE(NULLIF(k.doc_id, ''), m.qdrant_id)), '-', '') "
+                    "IN (SELECT value FROM json_each(?))"
+                )
+                params.append(allowed_ids_json)
+            params.append(limit)
+
+            cursor.execute(f"""
+                SELECT
+                    k.doc_id,
+                    k.rank as score,
+                    k.title,
+                    k.file_path,
+                    k.category,
+                    m.qdrant_id,
+                    m.chunk_index
+                FROM keyword_index k
+                LEFT JOIN doc_metadata m ON k.doc_id = m.doc_id
+                WHERE {" AND ".join(conditions)}
+                ORDER BY k.rank
+                LIMIT ?
+            """, params)
+
+            # 直接迭代游标构造结果，不先 fetchall 出整份行列表
+            return [
+                {**row, "score": abs(row["score"])}  # BM25 返回负分，取绝对值
+                for row in cursor
+            ]
 
         except Exception as e:
             logger.error(f"关键词检索失败: {e}")
@@ -330,14 +407,13 @@ class KeywordIndexManager:
             是否删除成功
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            conn = self._conn()
+            with self._write_lock, conn:
+                cursor = conn.cursor()
 
-            cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
-            cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
+                cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
+                cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
 
-            conn.commit()
-            conn.close()
             return True
 
         except Exception as e:
@@ -355,20 +431,17 @@ class KeywordIndexManager:
             是否删除成功
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            conn = self._conn()
+            with self._write_lock, conn:
+                cursor = conn.cursor()
 
-            # 先查找 doc_id
-            cursor.execute("SELECT doc_id FROM doc_metadata WHERE qdrant_id = ?", (qdrant_id,))
-            rows = cursor.fetchall()
-
-            for row in rows:
-                doc_id = row[0]
-                cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
-                cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
+                # 子查询一次删除所有相关文档（FTS 表 doc_id 无索引，逐条删除每次都要全表扫描）
+                cursor.execute("""
+                    DELETE FROM keyword_index
+                    WHERE doc_id IN (SELECT doc_id FROM doc_metadata WHERE qdrant_id = ?)
+                """, (qdrant_id,))
+                cursor.execute("DELETE FROM doc_metadata WHERE qdrant_id = ?", (qdrant_id,))
 
-            conn.commit()
-            conn.close()
             return True
 
         except Exception as e:
@@ -386,22 +459,17 @@ class KeywordIndexManager:
             删除的文档数量
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # 先查找所有相关 doc_id
-            cursor.execute("SELECT doc_id FROM doc_metadata WHERE file_path = ?", (file_path,))
-            rows = cursor.fetchall()
-
-            count = 0
-            for row in rows:
-                doc_id = row[0]
-                cursor.execute("DELETE FROM keyword_index WHERE doc_id = ?", (doc_id,))
-                cursor.execute("DELETE FROM doc_metadata WHERE doc_id = ?", (doc_id,))
-                count += 1
+            conn = self._conn()
+            with self._write_lock, conn:
+                cursor = conn.cursor()
 
-            conn.commit()
-            conn.close()
+                # 子查询一次删除所有相关文档（FTS 表 doc_id 无索引，逐条删除每次都要全表扫描）
+                cursor.execute("""
+                    DELETE FROM keyword_index
+                    WHERE doc_id IN (SELECT doc_id FROM doc_metadata WHERE file_path = ?)
+                """, (file_path,))
+                cursor.execute("DELETE FROM doc_metadata WHERE file_path = ?", (file_path,))
+                count = cursor.rowcount
 
             logger.info(f"删除文件 {file_path} 的关键词索引: {count} 条")
             return count
@@ -418,26 +486,19 @@ class KeywordIndexManager:
             统计信息字典
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._conn().cursor()
 
-            # 总文档数
-            cursor.execute("SELECT COUNT(*) FROM doc_metadata")
-            total_docs = cursor.fetchone()[0]
+            # 总文档数、文件数
+            cursor.execute("SELECT COUNT(*), COUNT(DISTINCT file_path) FROM doc_metadata")
+            total_docs, total_files = cursor.fetchone()
 
             # 按分类统计
             cursor.execute("""
-                SELECT category, COUNT(*)
+                SELECT category, COUNT(*) AS count
                 FROM doc_metadata
                 GROUP BY category
             """)
-            category_stats = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # 按文件统计
-            cursor.execute("SELECT COUNT(DISTINCT file_path) FROM doc_metadata")
-            total_files = cursor.fetchone()[0]
-
-            conn.close()
+            category_stats = {row["category"]: row["count"] for row in cursor.fetchall()}
 
             return {
                 "total_documents": total_docs,
@@ -457,14 +518,12 @@ class KeywordIndexManager:
             是否成功
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("DELETE FROM keyword_index")
-            cursor.execute("DELETE FROM doc_metadata")
+            conn = self._conn()
+            with self._write_lock, conn:
+                cursor = conn.cursor()
 
-            conn.commit()
-            conn.close()
+                cursor.execute("DELETE FROM keyword_index")
+                cursor.execute("DELETE FROM doc_metadata")
 
             logger.info("关键词索引已清空")
             return True
@@ -4,11 +4,13 @@ Query 改写器：生成多个查询变体以提高检索召回率
 """
 from typing import List, Optional
 import json
-import re
 
 from utils.llm import get_llm_client, BaseLLM
 from utils.logger import logger
 
+# 从 LLM 响应中解析 JSON 数组（raw_decode 允许数组后还有多余文字）
+_JSON_DECODER = json.JSONDecoder()
+
 
 class QueryRewriter:
     """Query 改写基类"""
@@ -90,10 +92,13 @@ class MultiQueryRewriter(QueryRewriter):
             llm_response = llm.invoke(messages)
             response_text = llm_response.content
 
-            # 提取 JSON 数组
-            json_match = re.search(r'\[[\s\S]*?\]', response_text)
-            if json_match:
-                variants = json.loads(json_match.group())
+            # 提取 JSON 数组：从第一个 "[" 开始解析，变体中包含 "]" 也能正确处理
+            start = response_text.find("[")
+            if start != -1:
+                try:
+                    variants, _ = _JSON_DECODER.raw_decode(response_text, start)
+                except json.JSONDecodeError:
+                    variants = None
                 if isinstance(variants, list) and len(variants) > 0:
                     logger.info(f"Query 改写成功: {query} -> {variants}")
                     return [query] + variants[:self.num_variants]
@@ -1,63 +1,171 @@
 """
 Reranker 模块：交叉编码重排（支持批处理和缓存）
 """
-from typing import List, Dict, Optional, Tuple
-import threading
+from typing import Any, List, Dict, Optional, Tuple
 import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
 import time
-from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
 
 from utils.logger import logger
 
 
 class LRUCache:
-    """带 TTL 的 LRU 缓存"""
+    """
+    带 TTL 的近似 LRU 缓存
 
-    def __init__(self, max_size: int = 100, ttl: int = 300):
+    读路径不加锁：只做一次字典查找和过期判断，命中时不调整顺序（按写入顺序淘汰）；
+    写入、淘汰、清理过期条目时才加锁。
+    """
+
+    def __init__(self, max_size: int = 100, ttl: int = 300, order_sensitive: bool = True):
         self.max_size = max_size
         self.ttl = ttl
-        self.cache: OrderedDict[str, Tuple[float, any]] = OrderedDict()
-        self.lock = threading.Lock()
+        # 检索结果按分数排序、顺序确定，默认按原顺序做键，省去每次排序
+        self.order_sensitive = order_sensitive
+        self._cache: Dict[Tuple[str, Tuple[str, ...]], Tuple[float, Any]] = {}  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
 
-    def _generate_key(self, query: str, doc_ids: List[str]) -> str:
-        """生成缓存键"""
-        content = f"{query}::{','.join(sorted(doc_ids))}"
-        return hashlib.md5(content.encode()).hexdigest()
+    def _generate_key(self, query: str, doc_ids: List[str]) -> Tuple[str, Tuple[str, ...]]:
+        """生成缓存键（元组直接作为字典键，无需拼接字符串再哈希）"""
+        return query, tuple(doc_ids) if self.order_sensitive else tuple(sorted(doc_ids))
 
-    def get(self, query: str, doc_ids: List[str]) -> Optional[List[Dict]]:
+    def get(self, query: str, doc_ids: List[str]) -> Optional[Any]:
         """获取缓存"""
         key = self._generate_key(query, doc_ids)
-        with self.lock:
-            if key not in self.cache:
-                return None
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
 
-            timestamp, value = self.cache[key]
-            # 检查是否过期
-            if time.time() - timestamp > self.ttl:
-                del self.cache[key]
-                return None
+        expires_at, value = entry
+        # 检查是否过期
+        if time.time() > expires_at:
+            with self._lock:
+                self._cache.pop(key, None)
+            return None
 
-            # 移到末尾（最近使用）
-            self.cache.move_to_end(key)
-            return value
+        return value
 
-    def set(self, query: str, doc_ids: List[str], value: List[Dict]):
+    def set(self, query: str, doc_ids: List[str], value: Any):
         """设置缓存"""
         key = self._generate_key(query, doc_ids)
-        with self.lock:
-            # 如果已存在，先删除
-            if key in self.cache:
-                del self.cache[key]
-            # 如果超过最大容量，删除最旧的
-            while len(self.cache) >= self.max_size:
-                self.cache.popitem(last=False)
+        with self._lock:
+            # 如果已存在，先删除（重新插入到末尾）
+            self._cache.pop(key, None)
+            # 如果超过最大容量，删除最早写入的
+            while len(self._cache) >= self.max_size:
+                self._cache.pop(next(iter(self._cache)))
             # 添加新条目
-            self.cache[key] = (time.time(), value)
+            self._cache[key] = (time.time() + self.ttl, value)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+
+
+_tokenize_pool: Optional[ThreadPoolExecutor] = None
+_tokenize_pool_lock = threading.Lock()
+
+# ONNX 自动导出：每个进程只启动一次后台导出；标记文件超过该时长视为残留
+ONNX_EXPORT_STALE_SEC = 3600
+_onnx_export_started = False
+_onnx_export_lock = threading.Lock()
+
+
+def _get_tokenize_pool() -> ThreadPoolExecutor:
+    """获取重排分词线程池（进程内共享）"""
+    global _tokenize_pool
+    if _tokenize_pool is None:
+        with _tokenize_pool_lock:
+            if _tokenize_pool is None:
+                _tokenize_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reranker-tokenize")
+    return _tokenize_pool
+
+
+class SharedScoreCache:
+    """
+    跨进程共享的重排分数缓存（SQLite WAL）
+
+    Gunicorn 多 worker 各自持有进程内 LRUCache，同一热点查询会在每个 worker 各算一遍；
+    本缓存作为二级缓存放在进程内缓存之后，值为 文档 ID -> 分数 的 JSON。
+    读写失败只记日志，不影响重排。
+    """
+
+    PURGE_EVERY = 256  # 每写入 N 次清理一次过期条目
+
+    def __init__(self, db_path: str, ttl: int = 300):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+        # 多个请求线程并发写入，itertools.count 的 next() 在 GIL 下是原子的，无需加锁
+        self._writes = itertools.count(1)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rerank_cache (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    scores TEXT NOT NULL
+                )
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的 SQLite 连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=1.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _generate_key(query: str, doc_ids: List[str]) -> str:
+        """与 LRUCache 默认键语义一致（按文档原顺序），哈希成定长字符串"""
+        raw = query + "\x1f" + "\x1f".join(doc_ids)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, doc_ids: List[str]) -> Optional[Dict[str, float]]:
+        """获取未过期的分数表"""
+        try:
+            row = self._conn().execute(
+                "SELECT scores FROM rerank_cache WHERE key = ? AND expires_at > ?",
+                (self._generate_key(query, doc_ids), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.debug(f"共享重排缓存读取失败: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, query: str, doc_ids: List[str], scores: Dict[str, float]):
+        """写入分数表"""
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rerank_cache (key, expires_at, scores) VALUES (?, ?, ?)",
+                    (self._generate_key(query, doc_ids), now + self.ttl, json.dumps(scores))
+                )
+                if next(self._writes) % self.PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM rerank_cache WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            logger.debug(f"共享重排缓存写入失败: {e}")
 
     def clear(self):
         """清空缓存"""
-        with self.lock:
-            self.cache.clear()
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM rerank_cache")
+        except sqlite3.Error as e:
+            logger.debug(f"共享重排缓存清空失败: {e}")
 
 
 class BaseReranker:
@@ -73,38 +181,84 @@ class CrossEncoderReranker(BaseReranker):
     def __init__(self):
         self._model = None
         self._tokenizer = None
+        self._backend = "torch"  # torch | onnx
         self._lock = threading.Lock()
+        self._loaded = threading.Event()
         self._load_failed = False
         self._cache: Optional[LRUCache] = None
+        self._cache_lock = threading.Lock()
+        self._shared_cache: Optional[SharedScoreCache] = None
+        self._shared_cache_checked = False
+        self._inflight: Dict[Tuple[str, Tuple[str, ...]], Future] = {}  # 正在计算的重排请求
+        self._inflight_lock = threading.Lock()
 
     def _get_cache(self) -> LRUCache:
-        """懒加载缓存"""
+        """懒加载缓存（创建后读取不加锁）"""
         if self._cache is None:
-            from config import RERANKER_CACHE_SIZE, RERANKER_CACHE_TTL
-            self._cache = LRUCache(max_size=RERANKER_CACHE_SIZE, ttl=RERANKER_CACHE_TTL)
+            with self._cache_lock:
+                if self._cache is None:
+                    from config import RERANKER_CACHE_SIZE, RERANKER_CACHE_TTL
+                    self._cache = LRUCache(max_size=RERANKER_CACHE_SIZE, ttl=RERANKER_CACHE_TTL)
         return self._cache
 
+    def _get_shared_cache(self) -> Optional[SharedScoreCache]:
+        """懒加载跨进程共享缓存（未配置路径时为 None）"""
+        if not self._shared_cache_checked:
+            with self._cache_lock:
+                if not self._shared_cache_checked:
+                    from config import RERANKER_SHARED_CACHE_PATH, RERANKER_CACHE_TTL
+                    if RERANKER_SHARED_CACHE_PATH:
+                        try:
+                            self._shared_cache = SharedScoreCache(RERANKER_SHARED_CACHE_PATH, ttl=RERANKER_CACHE_TTL)
+                        except (OSError, sqlite3.Error) as e:
+                            logger.warning(f"共享重排缓存初始化失败，仅使用进程内缓存: {e}")
+                    self._shared_cache_checked = True
+        return self._shared_cache
+
     def _lazy_load(self):
         """懒加载模型（首次调用时加载）"""
-        if self._model is not None or self._load_failed:
+        # 快路径：加载完成后只读一次 Event，不再取锁
+        if self._loaded.is_set() or self._load_failed:
             return
 
         with self._lock:
-            if self._model is not None or self._load_failed:
+            if self._loaded.is_set() or self._load_failed:
                 return
 
             try:
-                from config import RERANKER_MODEL_NAME, RERANKER_DEVICE
+                from config import (
+                    RERANKER_MODEL_NAME, RERANKER_DEVICE, RERANKER_ONNX_PATH, RERANKER_FP16, RERANKER_COMPILE
+                )
 
                 logger.info(f"正在加载 Reranker 模型: {RERANKER_MODEL_NAME}")
 
-                from transformers import AutoTokenizer, AutoModelForSequenceClassification
-                import torch
+                from transformers import AutoTokenizer
 
                 self._tokenizer = AutoTokenizer.from_pretrained(RERANKER_MODEL_NAME)
-                self._model = AutoModelForSequenceClassification.from_pretrained(
-                    RERANKER_MODEL_NAME
-                )
+
+                # 优先使用 INT8 量化的 ONNX 模型
+                if RERANKER_ONNX_PATH:
+                    session = self._load_onnx_session(RERANKER_ONNX_PATH)
+                    if session is not None:
+                        self._backend = "onnx"
+                        self._model = session
+                        self._loaded.set()
+                        logger.info(f"Reranker 模型加载完成: {RERANKER_ONNX_PATH} (ONNX Runtime)")
+                        return
+
+                from transformers import AutoModelForSequenceClassification
+                import torch
+
+                # 优先使用 PyTorch SDPA 融合注意力；旧版 transformers 或不支持的模型回退默认实现
+                try:
+                    model = AutoModelForSequenceClassification.from_pretrained(
+                        RERANKER_MODEL_NAME, attn_implementation="sdpa"
+                    )
+                except (TypeError, ValueError, ImportError) as e:
+                    logger.info(f"Reranker 不支持 SDPA 注意力，使用默认实现: {e}")
+                    model = AutoModelForSequenceClassification.from_pretrained(
+                        RERANKER_MODEL_NAME
+                    )
 
                 # 移动到指定设备
                 device = RERANKER_DEVICE
@@ -112,61 +266,182 @@ class CrossEncoderReranker(BaseReranker):
                     logger.warning("CUDA 不可用，回退到 CPU")
                     device = "cpu"
 
-                self._model = self._model.to(device)
-                self._model.eval()
-
-                logger.info(f"Reranker 模型加载完成: {RERANKER_MODEL_NAME} on {device}")
+                model = model.to(device)
+                # GPU 上半精度推理（Tensor Core），CPU 不支持 FP16 加速，保持 FP32
+                if device == "cuda" and RERANKER_FP16:
+                    model = model.half()
+                model.eval()
+
+                # torch.compile 融合 LayerNorm/Softmax/bias 等小算子；编译在首次前向时发生，失败时回退 eager
+                if RERANKER_COMPILE and hasattr(torch, "compile"):
+                    try:
+                        model = torch.compile(
+                            model,
+                            mode="reduce-overhead" if device == "cuda" else "default",
+                            dynamic=True,
+                        )
+                    except Exception as e:
+                        logger.warning(f"Reranker torch.compile 失败，使用 eager 模式: {e}")
+
+                # 模型完全就绪（设备、精度、编译）后再发布，其他线程不会拿到半初始化的模型
+                self._model = model
+                self._loaded.set()
+                logger.info(f"Reranker 模型加载完成: {RERANKER_MODEL_NAME} on {device} ({model.dtype})")
 
             except Exception as e:
                 logger.error(f"Reranker 模型加载失败: {e}")
                 self._load_failed = True
                 raise
 
-    def _compute_scores_batch(self, query: str, contents: List[str]) -> List[float]:
-        """批量计算重排分数"""
+    @staticmethod
+    def _load_onnx_session(model_path: str):
+        """加载 ONNX Runtime 推理会话，依赖或模型文件缺失时返回 None（回退 FP32 PyTorch）"""
+        if not os.path.isfile(model_path):
+            logger.warning(f"Reranker ONNX 模型不存在: {model_path}，回退到 PyTorch FP32")
+            # 导出耗时数分钟，放到后台线程，不阻塞当前请求；完成后由下次启动的 worker 使用
+            start_onnx_export()
+            return None
+
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.warning("未安装 onnxruntime，回退到 PyTorch FP32")
+            return None
+
+        from config import RERANKER_ONNX_THREADS
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if RERANKER_ONNX_THREADS > 0:
+            options.intra_op_num_threads = RERANKER_ONNX_THREADS
+
+        return ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def _forward(self, queries: List[str], docs: List[str], max_length: int) -> np.ndarray:
+        """对一批 (查询, 文档) 做一次前向计算"""
+        if self._backend == "onnx":
+            inputs = self._tokenizer(
+                queries,
+                docs,
+                max_length=max_length,
+                padding=True,
+                truncation=True,
+                return_tensors="np"
+            )
+            input_names = [i.name for i in self._model.get_inputs()]
+            feed = {name: inputs[name].astype(np.int64) for name in input_names if name in inputs}
+            logits = self._model.run(None, feed)[0]
+            if logits.shape[-1] == 1:
+                return logits.reshape(-1)
+            exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            return exp[:, 1] / exp.sum(axis=-1)
+
+        inputs = self._tokenize(queries, docs, max_length)
+        return self._run(inputs)
+
+    def _tokenize(self, queries: List[str], docs: List[str], max_length: int) -> Dict[str, Any]:
+        """PyTorch 后端的分词（可在后台线程执行）；GPU 上放入锁页内存，便于异步拷贝"""
+        # GPU 上序列长度补齐到 8 的倍数，半精度矩阵乘才能走 Tensor Core
+        on_cuda = self._model.device.type == "cuda"
+        inputs = self._tokenizer(
+            queries,
+            docs,
+            max_length=max_length,
+            padding=True,
+            truncation=True,
+            pad_to_multiple_of=8 if on_cuda else None,
+            return_tensors="pt"
+        )
+        if on_cuda:
+            inputs = {k: v.pin_memory() for k, v in inputs.items()}
+        return dict(inputs)
+
+    def _run(self, inputs: Dict[str, Any]) -> np.ndarray:
+        """PyTorch 后端对已分词的一批做前向计算"""
         import torch
+
+        # 移动到模型所在设备（锁页内存上的拷贝不阻塞 CPU，与默认流上的计算保持顺序）
+        device = self._model.device
+        inputs = {k: v.to(device, non_blocking=device.type == "cuda") for k, v in inputs.items()}
+
+        # 推理（inference_mode 比 no_grad 少做版本计数；半精度输出转回 FP32 再做 softmax）
+        with torch.inference_mode():
+            try:
+                logits = self._model(**inputs).logits.float()
+            except Exception as e:
+                # 编译后的模型在首次前向时才真正编译，出错则退回原始模型重试
+                eager = getattr(self._model, "_orig_mod", None)
+                if eager is None:
+                    raise
+                logger.warning(f"Reranker 编译模型推理失败，回退 eager 模式: {e}")
+                self._model = eager
+                logits = self._model(**inputs).logits.float()
+            # 整批一次转成 NumPy，不逐个装箱成 Python float
+            if logits.shape[-1] == 1:
+                return logits.view(-1).cpu().numpy()
+            return torch.softmax(logits, dim=-1)[:, 1].cpu().numpy()
+
+    def score_pairs(
+        self,
+        pairs: List[Tuple[str, str]],
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        批量计算 (查询, 文档) 对的相关性分数
+
+        候选数不超过 batch_size 时只做一次前向计算；按文档长度分组打包以减少 padding，
+        返回顺序与输入一致。调用前需确保模型已加载。
+        """
         from config import RERANKER_MAX_LENGTH, RERANKER_BATCH_SIZE
 
-        all_scores = []
-        num_docs = len(contents)
+        if not pairs:
+            return np.empty(0, dtype=np.float32)
 
-        # 分批处理
-        for i in range(0, num_docs, RERANKER_BATCH_SIZE):
-            batch_contents = contents[i:i + RERANKER_BATCH_SIZE]
-            batch_size = len(batch_contents)
+        batch_size = batch_size or RERANKER_BATCH_SIZE
+        max_length = max_length or RERANKER_MAX_LENGTH
 
-            # 构建查询-文档对
-            query_list = [query] * batch_size
-            doc_list = batch_contents
+        # 长度相近的文档放在同一批，padding 更少
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][1]))
+        scores = np.empty(len(pairs), dtype=np.float32)
 
-            # Tokenize
-            inputs = self._tokenizer(
-                query_list,
-                doc_list,
-                max_length=RERANKER_MAX_LENGTH,
-                padding=True,
-                truncation=True,
-                return_tensors="pt"
-            )
+        batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
 
-            # 移动到模型所在设备
-            inputs = {k: v.to(self._model.device) for k, v in inputs.items()}
+        def texts(batch_idx):
+            return [pairs[j][0] for j in batch_idx], [pairs[j][1] for j in batch_idx]
 
-            # 推理
-            with torch.no_grad():
-                outputs = self._model(**inputs)
-                if outputs.logits.shape[-1] == 1:
-                    batch_scores = outputs.logits.squeeze(-1).tolist()
-                else:
-                    batch_scores = torch.softmax(outputs.logits, dim=-1)[:, 1].tolist()
+        if len(batches) == 1 or self._backend != "torch":
+            for batch_idx in batches:
+                scores[batch_idx] = self._forward(*texts(batch_idx), max_length)
+            return scores
 
-            # 确保是列表
-            if not isinstance(batch_scores, list):
-                batch_scores = [batch_scores]
+        # 多批时流水线：第 i 批前向计算期间，后台线程为第 i+1 批分词（快速分词器执行时释放 GIL）
+        pool = _get_tokenize_pool()
+        inputs = self._tokenize(*texts(batches[0]), max_length)
+        for n, batch_idx in enumerate(batches):
+            pending = None
+            if n + 1 < len(batches):
+                pending = pool.submit(self._tokenize, *texts(batches[n + 1]), max_length)
+            batch_scores = self._run(inputs)
+            if pending is not None:
+                inputs = pending.result()
+            scores[batch_idx] = batch_scores
 
-            all_scores.extend(batch_scores)
+        return scores
+
+    def _compute_scores_batch(self, query: str, contents: List[str]) -> np.ndarray:
+        """批量计算重排分数"""
+        return self.score_pairs([(query, content) for content in contents])
 
-        return all_scores
+    @staticmethod
+    def _gather(docs: List[Dict], scores_arr: np.ndarray, top_k: int) -> List[Dict]:
+        """分数数组一次 argsort（稳定排序，同分保持原顺序），只为前 top_k 个构造结果 dict"""
+        order = np.argsort(-scores_arr, kind="stable")[:top_k]
+        return [{**docs[i], "rerank_score": float(scores_arr[i])} for i in order]
 
     def rerank(self, query: str, docs: List[Dict], top_k: int) -> List[Dict]:
         """
@@ -183,18 +458,35 @@ class CrossEncoderReranker(BaseReranker):
         if not docs:
             return docs
 
+        # 候选已按检索分数排序，只把前 M 个送入交叉编码（至少保留 top_k 个）
+        from config import RERANKER_MAX_CANDIDATES
+        if RERANKER_MAX_CANDIDATES > 0:
+            docs = docs[:max(top_k, RERANKER_MAX_CANDIDATES)]
+
         # 生成文档 ID 列表用于缓存
         doc_ids = []
         for doc in docs:
-            doc_id = doc.get("id") or doc.get("file_path", "") + ":" + str(doc.get("chunk_index", 0))
+            doc_id = str(doc.get("id") or doc.get("file_path", "") + ":" + str(doc.get("chunk_index", 0)))
             doc_ids.append(doc_id)
 
         # 检查缓存
         cache = self._get_cache()
-        cached_result = cache.get(query, doc_ids)
-        if cached_result is not None:
+        cached = cache.get(query, doc_ids)
+        if cached is not None:
             logger.debug(f"Reranker 缓存命中: query={query[:50]}...")
-            return cached_result[:top_k]
+            # 缓存值为 ID -> 分数，按当前文档顺序取回再排序
+            scores_arr = np.fromiter((cached[d] for d in doc_ids), dtype=np.float32, count=len(doc_ids))
+            return self._gather(docs, scores_arr, top_k)
+
+        # 二级缓存：其他 worker 可能已算过
+        shared_cache = self._get_shared_cache()
+        if shared_cache is not None:
+            cached = shared_cache.get(query, doc_ids)
+            if cached is not None and all(d in cached for d in doc_ids):
+                logger.debug(f"Reranker 共享缓存命中: query={query[:50]}...")
+                cache.set(query, doc_ids, cached)
+                scores_arr = np.fromiter((cached[d] for d in doc_ids), dtype=np.float32, count=len(doc_ids))
+                return self._gather(docs, scores_arr, top_k)
 
         # 尝试加载模型
         try:
@@ -206,36 +498,138 @@ class CrossEncoderReranker(BaseReranker):
         if self._load_failed:
             return docs[:top_k]
 
+        # 相同 (query, 文档集合) 的并发请求只计算一次，其余等待同一个 Future
+        key = cache._generate_key(query, doc_ids)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            try:
+                score_map = future.result()
+            except Exception:
+                return docs[:top_k]
+            scores_arr = np.fromiter((score_map[d] for d in doc_ids), dtype=np.float32, count=len(doc_ids))
+            return self._gather(docs, scores_arr, top_k)
+
         try:
             # 提取文档内容
             contents = [doc.get("content", "") for doc in docs]
 
             # 批量计算分数
-            scores = self._compute_scores_batch(query, contents)
+            scores_arr = self._compute_scores_batch(query, contents)
 
-            # 组装结果并排序
-            reranked = []
-            for doc, score in zip(docs, scores):
-                new_doc = {**doc, "rerank_score": float(score)}
-                reranked.append(new_doc)
-
-            reranked.sort(key=lambda x: x["rerank_score"], reverse=True)
-
-            # 存入缓存
-            cache.set(query, doc_ids, reranked)
+            # 缓存 文档 ID -> 分数，不同 top_k 的请求可复用（先写缓存再移出 in-flight，后到的请求直接命中）
+            score_map = dict(zip(doc_ids, scores_arr.tolist()))
+            cache.set(query, doc_ids, score_map)
+            if shared_cache is not None:
+                shared_cache.set(query, doc_ids, score_map)
+            future.set_result(score_map)
 
             logger.debug(f"Reranker 重排完成: {len(docs)} 文档, 批处理")
-            return reranked[:top_k]
+            return self._gather(docs, scores_arr, top_k)
 
         except Exception as e:
+            future.set_exception(e)
             logger.error(f"Reranker 推理失败，使用原排序: {e}")
             return docs[:top_k]
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
 
     def clear_cache(self):
         """清空缓存"""
         if self._cache:
             self._cache.clear()
             logger.info("Reranker 缓存已清空")
+        if self._shared_cache:
+            self._shared_cache.clear()
+
+
+def export_onnx_model(model_path: str) -> bool:
+    """
+    用 optimum 导出 ONNX 并做 INT8 动态量化，写到 model_path
+
+    多 worker 同时触发时借助 model_path + ".exporting" 标记文件只导出一次；
+    标记超过 ONNX_EXPORT_STALE_SEC 视为上次导出中途退出，允许重新导出。
+
+    Returns:
+        是否导出成功
+    """
+    import shutil
+    import tempfile
+
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        logger.warning("未安装 optimum[onnxruntime]，无法导出 Reranker ONNX 模型")
+        return False
+
+    from config import RERANKER_MODEL_NAME
+
+    os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+    marker = model_path + ".exporting"
+    try:
+        if time.time() - os.path.getmtime(marker) > ONNX_EXPORT_STALE_SEC:
+            os.remove(marker)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        logger.info(f"Reranker ONNX 模型正由其他进程导出: {marker}")
+        return False
+
+    logger.info(f"正在导出 Reranker ONNX 模型: {RERANKER_MODEL_NAME} -> {model_path}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ort_model = ORTModelForSequenceClassification.from_pretrained(RERANKER_MODEL_NAME, export=True)
+            ort_model.save_pretrained(tmp_dir)
+
+            # AVX512-VNNI 配置在不支持的 CPU 上同样可用（退化为普通 INT8 指令）
+            quantizer = ORTQuantizer.from_pretrained(tmp_dir)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+
+            shutil.move(os.path.join(tmp_dir, "model_quantized.onnx"), model_path)
+        logger.info(f"Reranker ONNX 模型导出完成: {model_path}（重启 worker 后生效）")
+        return True
+    except Exception as e:
+        logger.warning(f"Reranker ONNX 模型导出失败: {e}")
+        return False
+    finally:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+
+def start_onnx_export():
+    """
+    ONNX 模型缺失且开启 RERANKER_ONNX_EXPORT 时，在后台线程导出（每个进程最多启动一次）
+
+    导出期间重排继续使用 PyTorch，服务启动时即可调用，避免首个请求才触发。
+    """
+    global _onnx_export_started
+    from config import RERANKER_ONNX_PATH, RERANKER_ONNX_EXPORT
+
+    if not (RERANKER_ONNX_PATH and RERANKER_ONNX_EXPORT) or os.path.isfile(RERANKER_ONNX_PATH):
+        return
+    with _onnx_export_lock:
+        if _onnx_export_started:
+            return
+        _onnx_export_started = True
+
+    threading.Thread(
+        target=export_onnx_model,
+        args=(RERANKER_ONNX_PATH,),
+        daemon=True,
+        name="reranker-onnx-export"
+    ).start()
 
 
 # 全局单例
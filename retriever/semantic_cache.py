@@ -4,19 +4,27 @@
 """
 
 import hashlib
+import itertools
 import time
 import threading
+import uuid
 from typing import Optional, Dict, Any, List, Tuple
 from dataclasses import dataclass
+
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
     VectorParams, Distance, PointStruct,
-    Filter, FieldCondition, MatchValue
+    Filter, FieldCondition, MatchValue,
+    HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams,
+    Range, FilterSelector, PayloadSchemaType,
 )
 
+from utils.cache_version import SharedCacheVersion
 from utils.logger import logger
 from config import (
-    QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY
+    QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT
 )
 
 
@@ -29,6 +37,211 @@ class CacheEntry:
     created_at: float
     hit_count: int = 0
     last_hit_at: float = None
+    similarity: float = 0.0
+
+
+# 两级本地缓存：新条目进入近期层（LRU），每写入 PROMOTE_INTERVAL 条，
+# 把近期层中命中最多的条目晋升到高频层（LFU），避免热点被新条目挤出
+PROMOTE_INTERVAL = 50
+PROMOTE_COUNT = 16
+PROMOTE_MIN_HITS = 2
+
+# Qdrant 命中统计的后台批量写回间隔（秒）
+HIT_STATS_FLUSH_INTERVAL = 60
+
+# LSH 签名位数（随机超平面投影，每条向量压缩为一个 uint64）
+LSH_BITS = 64
+# 条目数超过此值才启用 LSH 预筛选（规模较小时全量矩阵乘更快）
+LSH_MIN_SIZE = 256
+# LSH 预筛选保留的最少候选数
+LSH_MIN_CANDIDATES = 64
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """逐元素统计 uint64 中置位的比特数"""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, LSH_BITS).sum(axis=1)
+
+
+class LocalVectorIndex:
+    """
+    进程内语义缓存热点索引
+
+    向量预先 L2 归一化后存放在预分配的 (N, D) float32 矩阵中，
+    查询时一次矩阵乘（BLAS）算出全部余弦相似度，命中则无需访问 Qdrant。
+    条目较多时先用 LSH 签名的汉明距离筛出约 √N 个候选，再做精确余弦计算。
+    已满时按淘汰策略替换：lru 淘汰最久未访问，lfu 淘汰命中最少（同频次淘汰最久未访问）。
+    """
+
+    def __init__(self, max_size: int = 1024, eviction: str = "lru"):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"不支持的淘汰策略: {eviction}")
+        self.max_size = max_size
+        self.eviction = eviction
+        self._lock = threading.Lock()
+        self._reset(0)
+
+    def _reset(self, dim: int):
+        """按维度重建存储（维度变化时旧向量全部失效）"""
+        self._dim = dim
+        self._size = 0
+        self._matrix = np.zeros((self.max_size, dim), dtype=np.float32)
+        # 固定种子，保证同一维度下签名稳定
+        self._projection = np.random.default_rng(0).standard_normal((dim, LSH_BITS)).astype(np.float32)
+        self._signatures = np.zeros(self.max_size, dtype=np.uint64)
+        self._last_access = np.zeros(self.max_size, dtype=np.float64)
+        self._hits = np.zeros(self.max_size, dtype=np.int64)
+        self._scopes = np.empty(self.max_size, dtype=object)
+        self._point_ids: List[Optional[str]] = [None] * self.max_size
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * self.max_size
+        self._slots: Dict[str, int] = {}
+
+    @staticmethod
+    def normalize(vector) -> np.ndarray:
+        """转为 L2 归一化的 float32 向量"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _signature(self, vector: np.ndarray) -> np.uint64:
+        """计算向量的 LSH 签名"""
+        bits = (vector @ self._projection) > 0
+        return np.packbits(bits, bitorder="little").view(np.uint64)[0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _victim_slot(self) -> int:
+        """按淘汰策略选出被替换的槽位"""
+        last_access = self._last_access[:self._size]
+        if self.eviction == "lfu":
+            # lexsort 以最后一个键为主键：先比命中次数，再比最后访问时间
+            return int(np.lexsort((last_access, self._hits[:self._size]))[0])
+        return int(np.argmin(last_access))
+
+    def __contains__(self, point_id: str) -> bool:
+        return point_id in self._slots
+
+    def add(self, point_id: str, vector: np.ndarray, payload: Dict[str, Any], hits: Optional[int] = None):
+        """写入或更新一条缓存（vector 需已归一化；hits 为空时新条目记 0，已有条目保留原命中数）"""
+        with self._lock:
+            if vector.shape[0] != self._dim:
+                self._reset(vector.shape[0])
+
+            slot = self._slots.get(point_id)
+            if hits is None:
+                hits = int(self._hits[slot]) if slot is not None else 0
+            if slot is None:
+                if self._size < self.max_size:
+                    slot = self._size
+                    self._size += 1
+                else:
+                    slot = self._victim_slot()
+                    del self._slots[self._point_ids[slot]]
+                self._slots[point_id] = slot
+
+            self._matrix[slot] = vector
+            self._signatures[slot] = self._signature(vector)
+            self._last_access[slot] = time.time()
+            self._hits[slot] = hits
+            self._scopes[slot] = payload.get("scope", "")
+            self._point_ids[slot] = point_id
+            self._payloads[slot] = payload
+
+    def _remove_locked(self, point_id: str):
+        """删除一条缓存（调用方需持有锁；用最后一条填补空位，保持矩阵连续）"""
+        slot = self._slots.pop(point_id, None)
+        if slot is None:
+            return
+        last = self._size - 1
+        if slot != last:
+            self._matrix[slot] = self._matrix[last]
+            self._signatures[slot] = self._signatures[last]
+            self._last_access[slot] = self._last_access[last]
+            self._hits[slot] = self._hits[last]
+            self._scopes[slot] = self._scopes[last]
+            self._point_ids[slot] = self._point_ids[last]
+            self._payloads[slot] = self._payloads[last]
+            self._slots[self._point_ids[slot]] = slot
+        self._point_ids[last] = None
+        self._payloads[last] = None
+        self._scopes[last] = None
+        self._size = last
+
+    def remove(self, point_id: str):
+        """删除一条缓存"""
+        with self._lock:
+            self._remove_locked(point_id)
+
+    def pop_most_hit(
+        self,
+        count: int,
+        min_hits: int = 1
+    ) -> List[Tuple[str, np.ndarray, Dict[str, Any], int]]:
+        """
+        取出命中次数最多的若干条目（从本索引中移除）
+
+        Returns:
+            [(point_id, vector, payload, hits), ...]
+        """
+        with self._lock:
+            if self._size == 0:
+                return []
+            hits = self._hits[:self._size]
+            order = np.argsort(-hits, kind="stable")[:count]
+            popped = [
+                (self._point_ids[slot], self._matrix[slot].copy(), self._payloads[slot], int(hits[slot]))
+                for slot in order
+                if hits[slot] >= min_hits
+            ]
+            for point_id, _, _, _ in popped:
+                self._remove_locked(point_id)
+            return popped
+
+    def search(
+        self,
+        vector: np.ndarray,
+        scope: str,
+        threshold: float
+    ) -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """
+        查找同一范围内相似度最高且超过阈值的条目（命中时更新访问时间和命中次数）
+
+        Returns:
+            (point_id, payload, score)，未命中返回 None
+        """
+        with self._lock:
+            if self._size == 0 or vector.shape[0] != self._dim:
+                return None
+            in_scope = self._scopes[:self._size] == scope
+
+            if self._size > LSH_MIN_SIZE:
+                # LSH 预筛选：按汉明距离取候选，只对候选做精确余弦计算
+                distances = _popcount64(self._signatures[:self._size] ^ self._signature(vector))
+                distances[~in_scope] = LSH_BITS + 1
+                num_candidates = min(self._size, max(LSH_MIN_CANDIDATES, int(np.sqrt(self._size))))
+                candidates = np.argpartition(distances, num_candidates - 1)[:num_candidates]
+                candidates = candidates[in_scope[candidates]]
+            else:
+                candidates = np.flatnonzero(in_scope)
+
+            if candidates.size == 0:
+                return None
+            scores = self._matrix[candidates] @ vector
+            best_pos = int(scores.argmax())
+            score = float(scores[best_pos])
+            if score < threshold:
+                return None
+            best = int(candidates[best_pos])
+            self._hits[best] += 1
+            self._last_access[best] = time.time()
+            return self._point_ids[best], self._payloads[best], score
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._reset(self._dim)
 
 
 class SemanticCache:
@@ -44,6 +257,8 @@ class SemanticCache:
     - 支持 TTL 过期
     - 命中统计
     - 后台定时清理（避免阻塞主线程）
+    - 进程内两级热点索引（近期层 LRU + 高频层 LFU，命中时不访问 Qdrant）
+    - 跨进程版本号：任一进程清空缓存后，各进程的本地热点层在下次查询前整体失效
     """
 
     COLLECTION_NAME = "semantic_cache"
@@ -54,7 +269,9 @@ class SemanticCache:
         similarity_threshold: float = 0.92,
         ttl_seconds: int = 86400 * 7,  # 默认 7 天
         max_cache_size: int = 10000,
-        cleanup_interval: int = 3600  # 清理间隔（秒），默认 1 小时
+        cleanup_interval: int = 3600,  # 清理间隔（秒），默认 1 小时
+        recent_cache_size: int = 256,
+        frequent_cache_size: int = 4096
     ):
         """
         初始化语义缓存
@@ -65,12 +282,14 @@ class SemanticCache:
             ttl_seconds: 缓存过期时间（秒）
             max_cache_size: 最大缓存条目数
             cleanup_interval: 后台清理间隔（秒）
+            recent_cache_size: 本地近期层容量（LRU 淘汰）
+            frequent_cache_size: 本地高频层容量（LFU 淘汰）
         """
         # 如果没有提供 embedding_func，自动创建
         if embedding_func is None:
             from utils.embeddings import EmbeddingModel
             self._embedding_model = EmbeddingModel()
-            self.embedding_func = lambda text: self._embedding_model.embed(text)
+            self.embedding_func = lambda text: self._embedding_model.embed_query(text).tolist()
         else:
             self._embedding_model = None
             self.embedding_func = embedding_func
@@ -79,6 +298,15 @@ class SemanticCache:
         self.ttl_seconds = ttl_seconds
         self.max_cache_size = max_cache_size
         self.cleanup_interval = cleanup_interval
+        self._recent_index = LocalVectorIndex(max_size=recent_cache_size, eviction="lru")
+        self._frequent_index = LocalVectorIndex(max_size=frequent_cache_size, eviction="lfu")
+        self._local_writes = itertools.count(1)
+        # 本地热点层对应的共享版本号，其他 worker 清空缓存时递增
+        self._version = SharedCacheVersion("semantic_cache")
+        self._local_version = self._version.get()
+        # 待写回 Qdrant 的命中统计：point_id -> [新增命中数, 最后命中时间]（基数在写回时从 Qdrant 重新读取）
+        self._pending_hits: Dict[str, List] = {}
+        self._pending_hits_lock = threading.Lock()
 
         # 初始化 Qdrant 客户端
         # 判断是否使用 HTTPS
@@ -86,7 +314,9 @@ class SemanticCache:
             # 如果 host 包含协议，直接使用 URL 模式
             self.client = QdrantClient(
                 url=f"{QDRANT_HOST}:{QDRANT_PORT}" if not QDRANT_HOST.startswith('http') else QDRANT_HOST,
-                api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
+                api_key=QDRANT_API_KEY if QDRANT_API_KEY else None,
+                prefer_grpc=QDRANT_PREFER_GRPC,
+                grpc_port=QDRANT_GRPC_PORT
             )
         else:
             # 否则使用 host/port 模式
@@ -94,7 +324,9 @@ class SemanticCache:
                 host=QDRANT_HOST,
                 port=QDRANT_PORT,
                 api_key=QDRANT_API_KEY if QDRANT_API_KEY else None,
-                https=False  # 明确禁用 HTTPS
+                https=False,  # 明确禁用 HTTPS
+                prefer_grpc=QDRANT_PREFER_GRPC,
+                grpc_port=QDRANT_GRPC_PORT
             )
 
         self._init_collection()
@@ -130,20 +362,104 @@ class SemanticCache:
                 vectors_config=VectorParams(
                     size=embedding_dim,
                     distance=Distance.COSINE
-                )
+                ),
+                # 缓存只取 top-1，INT8 量化常驻内存 + 较小的 HNSW 图即可
+                hnsw_config=HnswConfigDiff(m=16, ef_construct=100),
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+                ),
             )
             logger.info(f"创建语义缓存集合: {self.COLLECTION_NAME}, 维度: {embedding_dim}")
 
-    def _generate_id(self, question: str) -> str:
-        """生成缓存 ID"""
-        return hashlib.md5(question.encode()).hexdigest()
+        # created_at 建索引，过期清理按范围过滤在服务端完成（已存在时为幂等操作）
+        try:
+            self.client.create_payload_index(
+                collection_name=self.COLLECTION_NAME,
+                field_name="created_at",
+                field_schema=PayloadSchemaType.FLOAT,
+            )
+        except Exception as e:
+            logger.warning(f"创建 created_at 索引失败: {e}")
+
+    def _generate_id(self, question: str, scope: str = "") -> str:
+        """生成缓存 ID（与 Qdrant 返回的 UUID 格式一致）"""
+        return str(uuid.UUID(hashlib.md5(f"{question}||{scope}".encode()).hexdigest()))
+
+    def _resolve_vector(self, question: str, query_vector=None) -> np.ndarray:
+        """获取归一化的问题向量（优先复用调用方已计算的向量）"""
+        if query_vector is None:
+            query_vector = self.embedding_func(question)
+        return LocalVectorIndex.normalize(query_vector)
+
+    def _sync_local_tiers(self) -> bool:
+        """
+        比对共享版本号，版本变化时清空本地热点层
+
+        Returns:
+            本地热点层是否可用（版本号读取失败时不可用，只查 Qdrant）
+        """
+        version = self._version.get()
+        if version is None:
+            return False
+        if version != self._local_version:
+            self._recent_index.clear()
+            self._frequent_index.clear()
+            self._local_version = version
+            logger.info("语义缓存版本已变化，清空本地热点层")
+        return True
+
+    def _local_search(
+        self,
+        vector: np.ndarray,
+        scope: str
+    ) -> Optional[Tuple[LocalVectorIndex, str, Dict[str, Any], float]]:
+        """依次查询高频层、近期层"""
+        for index in (self._frequent_index, self._recent_index):
+            hit = index.search(vector, scope, self.similarity_threshold)
+            if hit:
+                return (index,) + hit
+        return None
+
+    def _remember_local(self, point_id: str, vector: np.ndarray, payload: Dict[str, Any]):
+        """写入本地缓存（已在高频层的直接更新），并定期晋升高频条目"""
+        if point_id in self._frequent_index:
+            self._frequent_index.add(point_id, vector, payload)
+            return
+
+        self._recent_index.add(point_id, vector, payload)
+        if next(self._local_writes) % PROMOTE_INTERVAL == 0:
+            promoted = self._recent_index.pop_most_hit(PROMOTE_COUNT, min_hits=PROMOTE_MIN_HITS)
+            for promoted_id, promoted_vector, promoted_payload, hits in promoted:
+                self._frequent_index.add(promoted_id, promoted_vector, promoted_payload, hits=hits)
+            if promoted:
+                logger.debug(f"语义缓存晋升高频层: {len(promoted)} 条")
+
+    @staticmethod
+    def _to_entry(payload: Dict[str, Any], similarity: float) -> CacheEntry:
+        """payload 转为缓存条目"""
+        return CacheEntry(
+            question=payload.get("question", ""),
+            answer=payload.get("answer", ""),
+            sources=payload.get("sources", []),
+            created_at=payload.get("created_at", 0),
+            hit_count=payload.get("hit_count", 0) + 1,
+            last_hit_at=time.time(),
+            similarity=similarity
+        )
 
-    def get(self, question: str) -> Optional[CacheEntry]:
+    def get(
+        self,
+        question: str,
+        query_vector=None,
+        scope: str = ""
+    ) -> Optional[CacheEntry]:
         """
         查询缓存
 
         Args:
             question: 用户问题
+            query_vector: 预先计算的问题向量，提供时跳过嵌入
+            scope: 缓存隔离范围（如分组/用户），只匹配同一范围内的缓存
 
         Returns:
             CacheEntry 如果命中，否则 None
@@ -152,14 +468,42 @@ class SemanticCache:
 
         try:
             # 生成问题向量
-            query_vector = self.embedding_func(question)
-
-            # 向量搜索
+            vector = self._resolve_vector(question, query_vector)
+
+            # 先查进程内两级热点索引（其他进程清空过缓存时先丢弃本地内容）
+            local_hit = self._local_search(vector, scope) if self._sync_local_tiers() else None
+            if local_hit:
+                index, point_id, payload, score = local_hit
+                if time.time() - payload.get("created_at", 0) > self.ttl_seconds:
+                    index.remove(point_id)
+                    self._delete_point(point_id)
+                    self.stats["misses"] += 1
+                    logger.debug(f"缓存过期: {question[:50]}...")
+                    return None
+
+                self.stats["hits"] += 1
+                self._record_hit(point_id)
+                entry = self._to_entry(payload, score)
+                # 本地 payload 同步累加，返回的命中次数与本进程的累计一致
+                payload["hit_count"] = entry.hit_count
+                logger.info(f"语义缓存命中 (本地, 相似度: {score:.4f}): {question[:50]}...")
+                return entry
+
+            # 向量搜索（按范围过滤，避免不同分组/用户的缓存互相命中）
             results = self.client.search(
                 collection_name=self.COLLECTION_NAME,
-                query_vector=query_vector,
+                query_vector=vector.tolist(),
+                query_filter=Filter(must=[
+                    FieldCondition(key="scope", match=MatchValue(value=scope))
+                ]),
                 limit=1,
-                score_threshold=self.similarity_threshold
+                score_threshold=self.similarity_threshold,
+                with_vectors=True,
+                # 量化向量粗排后用原始向量重打分，保证阈值判断精度
+                search_params=SearchParams(
+                    hnsw_ef=32,
+                    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0),
+                ),
             )
 
             if not results:
@@ -180,18 +524,17 @@ class SemanticCache:
 
             # 命中，更新统计
             self.stats["hits"] += 1
-            self._update_hit_stats(result.id)
+            self._record_hit(str(result.id))
+            entry = self._to_entry(payload, result.score)
+            payload["hit_count"] = entry.hit_count
+
+            # 载入热点索引，后续相似问题直接本地命中
+            if result.vector is not None:
+                self._remember_local(str(result.id), LocalVectorIndex.normalize(result.vector), payload)
 
             logger.info(f"语义缓存命中 (相似度: {result.score:.4f}): {question[:50]}...")
 
-            return CacheEntry(
-                question=payload.get("question", ""),
-                answer=payload.get("answer", ""),
-                sources=payload.get("sources", []),
-                created_at=created_at,
-                hit_count=payload.get("hit_count", 0) + 1,
-                last_hit_at=time.time()
-            )
+            return entry
 
         except Exception as e:
             logger.error(f"语义缓存查询失败: {e}")
@@ -202,7 +545,9 @@ class SemanticCache:
         self,
         question: str,
         answer: str,
-        sources: List[Dict[str, Any]] = None
+        sources: List[Dict[str, Any]] = None,
+        query_vector=None,
+        scope: str = ""
     ) -> bool:
         """
         设置缓存
@@ -211,6 +556,8 @@ class SemanticCache:
             question: 用户问题
             answer: LLM 回答
             sources: 引用来源
+            query_vector: 预先计算的问题向量，提供时跳过嵌入
+            scope: 缓存隔离范围（如分组/用户）
 
         Returns:
             是否成功
@@ -220,10 +567,20 @@ class SemanticCache:
             self._check_cache_size()
 
             # 生成向量
-            question_vector = self.embedding_func(question)
+            question_vector = self._resolve_vector(question, query_vector)
 
             # 生成 ID
-            point_id = self._generate_id(question)
+            point_id = self._generate_id(question, scope)
+
+            payload = {
+                "question": question,
+                "scope": scope,
+                "answer": answer,
+                "sources": sources or [],
+                "created_at": time.time(),
+                "hit_count": 0,
+                "last_hit_at": None
+            }
 
             # 存储
             self.client.upsert(
@@ -231,18 +588,12 @@ class SemanticCache:
                 points=[
                     PointStruct(
                         id=point_id,
-                        vector=question_vector,
-                        payload={
-                            "question": question,
-                            "answer": answer,
-                            "sources": sources or [],
-                            "created_at": time.time(),
-                            "hit_count": 0,
-                            "last_hit_at": None
-                        }
+                        vector=question_vector.tolist(),
+                        payload=payload
                     )
                 ]
             )
+            self._remember_local(point_id, question_vector, payload)
 
             logger.debug(f"语义缓存写入: {question[:50]}...")
             return True
@@ -251,28 +602,51 @@ class SemanticCache:
             logger.error(f"语义缓存写入失败: {e}")
             return False
 
-    def _update_hit_stats(self, point_id: str):
-        """更新命中统计"""
+    def _record_hit(self, point_id: str):
+        """记录一次命中（只写内存，由后台线程批量写回 Qdrant，不占用请求耗时）"""
+        with self._pending_hits_lock:
+            pending = self._pending_hits.get(point_id)
+            if pending is None:
+                self._pending_hits[point_id] = [1, time.time()]
+            else:
+                pending[0] += 1
+                pending[1] = time.time()
+
+    def _flush_hit_stats(self):
+        """
+        把累积的命中统计写回 Qdrant
+
+        写回前用一次批量 retrieve 重新读取当前 hit_count（只取该字段），在最新值上累加，
+        多个 worker 先后写回同一条目时不会互相覆盖；已被删除的条目直接跳过。
+        set_payload 只更新给定字段，不回传整份答案与来源。
+        """
+        with self._pending_hits_lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        if not pending:
+            return
+
         try:
-            # 获取当前 payload
             points = self.client.retrieve(
                 collection_name=self.COLLECTION_NAME,
-                ids=[point_id]
+                ids=list(pending),
+                with_payload=["hit_count"],
+                with_vectors=False
             )
+        except Exception as e:
+            logger.warning(f"读取缓存命中统计失败: {e}")
+            return
 
-            if points:
-                payload = points[0].payload
-                payload["hit_count"] = payload.get("hit_count", 0) + 1
-                payload["last_hit_at"] = time.time()
-
-                # 更新 payload
+        for point in points:
+            new_hits, last_hit_at = pending[str(point.id)]
+            hit_count = (point.payload or {}).get("hit_count", 0)
+            try:
                 self.client.set_payload(
                     collection_name=self.COLLECTION_NAME,
-                    payload=payload,
-                    points=[point_id]
+                    payload={"hit_count": hit_count + new_hits, "last_hit_at": last_hit_at},
+                    points=[point.id]
                 )
-        except Exception as e:
-            logger.warning(f"更新缓存命中统计失败: {e}")
+            except Exception as e:
+                logger.warning(f"更新缓存命中统计失败: {e}")
 
     def _delete_point(self, point_id: str):
         """删除缓存点"""
@@ -284,6 +658,18 @@ class SemanticCache:
         except Exception as e:
             logger.warning(f"删除缓存点失败: {e}")
 
+    def _forget_local(self, point_ids: List[str]):
+        """
+        Qdrant 中已删除的条目同步移出本地两级热点层
+
+        本进程先按 ID 移除；其他 worker 无从得知删了哪些 ID，递增共享版本号让各进程
+        （包括本进程）在下次查询前整体重建（高频层保留的恰是最热的条目，不同步就会一直命中已删除的缓存）。
+        """
+        for point_id in point_ids:
+            self._recent_index.remove(point_id)
+            self._frequent_index.remove(point_id)
+        self._version.bump()
+
     def _check_cache_size(self):
         """检查并清理缓存大小"""
         try:
@@ -321,6 +707,7 @@ class SemanticCache:
                         collection_name=self.COLLECTION_NAME,
                         points_selector=ids_to_delete
                     )
+                    self._forget_local([str(point_id) for point_id in ids_to_delete])
         except Exception as e:
             logger.warning(f"清理旧缓存失败: {e}")
 
@@ -328,12 +715,19 @@ class SemanticCache:
         """启动后台清理线程"""
         def cleanup_worker():
             logger.info("语义缓存后台清理线程已启动")
-            while not self._stop_cleanup.wait(self.cleanup_interval):
+            next_cleanup = time.time() + self.cleanup_interval
+            while not self._stop_cleanup.wait(min(self.cleanup_interval, HIT_STATS_FLUSH_INTERVAL)):
+                self._flush_hit_stats()
+                if time.time() < next_cleanup:
+                    continue
+                next_cleanup = time.time() + self.cleanup_interval
                 try:
                     self._cleanup_expired()
                     self._check_cache_size()
                 except Exception as e:
                     logger.warning(f"后台清理任务失败: {e}")
+            # 退出前写回剩余的命中统计
+            self._flush_hit_stats()
             logger.info("语义缓存后台清理线程已停止")
 
         self._cleanup_thread = threading.Thread(
@@ -349,38 +743,14 @@ class SemanticCache:
             current_time = time.time()
             expired_threshold = current_time - self.ttl_seconds
 
-            # 滚动查询所有点，找出过期的
-            offset = None
-            expired_ids = []
-
-            while True:
-                results = self.client.scroll(
-                    collection_name=self.COLLECTION_NAME,
-                    limit=100,
-                    offset=offset,
-                    with_payload=True
-                )
-
-                points, next_offset = results
-                if not points:
-                    break
-
-                for point in points:
-                    created_at = point.payload.get("created_at", 0)
-                    if created_at < expired_threshold:
-                        expired_ids.append(point.id)
-
-                if next_offset is None:
-                    break
-                offset = next_offset
-
-            # 批量删除过期缓存
-            if expired_ids:
-                self.client.delete(
-                    collection_name=self.COLLECTION_NAME,
-                    points_selector=expired_ids
-                )
-                logger.info(f"清理过期缓存: 删除 {len(expired_ids)} 条")
+            # 按 created_at 范围在服务端筛选并删除，一次请求完成
+            self.client.delete(
+                collection_name=self.COLLECTION_NAME,
+                points_selector=FilterSelector(filter=Filter(must=[
+                    FieldCondition(key="created_at", range=Range(lt=expired_threshold))
+                ])),
+            )
+            logger.debug(f"清理过期缓存: 删除 created_at < {expired_threshold:.0f} 的条目")
 
         except Exception as e:
             logger.warning(f"清理过期缓存失败: {e}")
@@ -397,6 +767,10 @@ class SemanticCache:
         try:
             self.client.delete_collection(self.COLLECTION_NAME)
             self._init_collection()
+            self._recent_index.clear()
+            self._frequent_index.clear()
+            # 通知其他 worker 丢弃本地热点层
+            self._version.bump()
             self.stats = {"hits": 0, "misses": 0, "total_queries": 0}
             logger.info("语义缓存已清空")
         except Exception as e:
@@ -420,29 +794,34 @@ class SemanticCache:
             "total_queries": self.stats["total_queries"],
             "hit_rate": f"{hit_rate:.2%}",
             "cache_size": cache_size,
+            "local_recent_size": len(self._recent_index),
+            "local_frequent_size": len(self._frequent_index),
             "max_cache_size": self.max_cache_size,
             "similarity_threshold": self.similarity_threshold,
             "ttl_seconds": self.ttl_seconds
         }
 
 
-# 全局缓存实例（延迟初始化）
+# 全局缓存实例（延迟初始化，问答链与管理接口共用同一实例）
 _cache_instance: Optional[SemanticCache] = None
+_cache_instance_lock = threading.Lock()
 
 
-def get_semantic_cache(embedding_func=None) -> Optional[SemanticCache]:
+def get_semantic_cache(embedding_func=None) -> SemanticCache:
     """
-    获取语义缓存实例
+    获取进程内共享的语义缓存实例
 
     Args:
-        embedding_func: 嵌入函数（首次调用时必须提供）
+        embedding_func: 嵌入函数（仅首次创建时使用，为 None 时自动创建嵌入模型）
 
     Returns:
-        SemanticCache 实例
+        SemanticCache 实例（初始化失败时抛出异常，下次调用重试）
     """
     global _cache_instance
 
-    if _cache_instance is None and embedding_func is not None:
-        _cache_instance = SemanticCache(embedding_func)
+    if _cache_instance is None:
+        with _cache_instance_lock:
+            if _cache_instance is None:
+                _cache_instance = SemanticCache(embedding_func)
 
     return _cache_instance
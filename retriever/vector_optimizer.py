@@ -1,61 +1,77 @@
 """
 向量索引优化器
-- HNSW 参数调优
+- HNSW 参数调优 / INT8 量化
 - 批量写入优化
 - 索引预热
 """
+import os
 import time
 from typing import Optional
-from qdrant_client import QdrantClient
 from qdrant_client.models import (
     OptimizersConfigDiff,
     HnswConfigDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
     VectorParams,
     Distance,
+    SearchRequest,
 )
+from utils.config_manager import get_config
 from utils.logger import logger
-from config import (
-    QDRANT_HOST,
-    QDRANT_PORT,
-    QDRANT_API_KEY,
-    QDRANT_COLLECTION_NAME,
-)
+from config import QDRANT_COLLECTION_NAME
+
+
+def _available_ram_bytes() -> int:
+    """本机可用物理内存（字节），平台不支持时返回 0"""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 0
 
 
 class VectorIndexOptimizer:
     """向量索引优化器"""
 
-    # HNSW 优化参数配置
+    # 预热时每次 search_batch 请求包含的查询数
+    WARMUP_BATCH_SIZE = 20
+
+    # INT8 标量量化：向量内存降为 1/4，量化向量常驻内存，原始向量用于重打分
+    INT8_QUANTIZATION = ScalarQuantization(
+        scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+
+    # HNSW 优化参数配置（quantization 为 None 时不改动集合现有的量化配置）
     HNSW_CONFIGS = {
         "default": {
             "m": 16,              # 每个节点的连接数
             "ef_construct": 100,  # 构建时的搜索宽度
             "full_scan_threshold": 10000,  # 全扫描阈值
+            "quantization": None,
         },
         "high_recall": {
             "m": 32,              # 更多连接，更高召回
             "ef_construct": 200,  # 更大搜索宽度
             "full_scan_threshold": 20000,
+            "quantization": None,  # 追求召回，不量化
         },
         "fast_search": {
             "m": 8,               # 较少连接，更快搜索
             "ef_construct": 64,   # 较小搜索宽度
             "full_scan_threshold": 5000,
+            "quantization": INT8_QUANTIZATION,
         },
         "balanced": {
             "m": 16,
             "ef_construct": 128,
             "full_scan_threshold": 15000,
+            "quantization": INT8_QUANTIZATION,
         },
     }
 
     def __init__(self):
         """初始化优化器"""
-        self.client = QdrantClient(
-            host=QDRANT_HOST,
-            port=QDRANT_PORT,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None,
-        )
+        self.client = get_config().qdrant_client
         self.collection_name = QDRANT_COLLECTION_NAME
 
     def get_collection_info(self) -> dict:
@@ -103,6 +119,7 @@ class VectorIndexOptimizer:
                     ef_construct=config["ef_construct"],
                     full_scan_threshold=config["full_scan_threshold"],
                 ),
+                quantization_config=config["quantization"],
             )
             logger.info("HNSW 参数更新成功")
             return True
@@ -193,12 +210,13 @@ class VectorIndexOptimizer:
         logger.warning("索引优化超时")
         return False
 
-    def warmup_index(self, sample_queries: int = 100) -> dict:
+    def warmup_index(self, sample_queries: int = 100, vector_size: Optional[int] = None) -> dict:
         """
-        预热索引（通过执行示例查询）
+        预热索引（用集合中已有的向量执行示例查询，按批提交）
 
         Args:
             sample_queries: 示例查询数量
+            vector_size: 向量维度（已知时传入，省去一次集合信息查询）
 
         Returns:
             预热统计
@@ -216,32 +234,29 @@ class VectorIndexOptimizer:
         }
 
         try:
-            # 从集合配置获取向量维度
-            info = self.get_collection_info()
-            vector_size = info.get("config", {}).get("vector_size")
-            if not vector_size:
+            query_vectors = self._sample_query_vectors(sample_queries, vector_size)
+            if query_vectors is None:
                 logger.warning("无法获取向量维度，跳过预热")
                 return stats
 
-            for i in range(sample_queries):
-                # 生成随机查询向量
-                query_vector = np.random.rand(vector_size).tolist()
+            for i in range(0, len(query_vectors), self.WARMUP_BATCH_SIZE):
+                batch = query_vectors[i:i + self.WARMUP_BATCH_SIZE]
+                requests = [SearchRequest(vector=v.tolist(), limit=10) for v in batch]
 
                 start = time.time()
-                self.client.search(
+                self.client.search_batch(
                     collection_name=self.collection_name,
-                    query_vector=query_vector,
-                    limit=10,
+                    requests=requests,
                 )
-                elapsed = time.time() - start
+                # 批内每条查询的平均耗时
+                elapsed = (time.time() - start) / len(requests)
 
-                stats["queries"] += 1
-                stats["total_time"] += elapsed
+                stats["queries"] += len(requests)
+                stats["total_time"] += elapsed * len(requests)
                 stats["min_time"] = min(stats["min_time"], elapsed)
                 stats["max_time"] = max(stats["max_time"], elapsed)
 
-                if (i + 1) % 20 == 0:
-                    logger.debug(f"预热进度: {i + 1}/{sample_queries}")
+                logger.debug(f"预热进度: {stats['queries']}/{sample_queries}")
 
             stats["avg_time"] = stats["total_time"] / stats["queries"] if stats["queries"] > 0 else 0
             stats["min_time"] = stats["min_time"] if stats["min_time"] != float('inf') else 0
@@ -253,17 +268,57 @@ class VectorIndexOptimizer:
             logger.error(f"索引预热失败: {e}")
             return stats
 
-    def get_optimization_recommendations(self) -> list:
+    def _sample_query_vectors(self, sample_queries: int, vector_size: Optional[int] = None):
+        """
+        取预热用的查询向量
+
+        优先 scroll 集合中已有的向量：以真实向量查询，访问的正是线上查询会命中的图节点和页面；
+        集合数据不足时用归一化的随机向量补齐。无法确定维度时返回 None。
+        """
+        import numpy as np
+
+        points, _ = self.client.scroll(
+            collection_name=self.collection_name,
+            limit=sample_queries,
+            with_payload=False,
+            with_vectors=True,
+        )
+        # 只使用单一未命名向量（命名向量的 point.vector 为 dict）
+        real = [p.vector for p in points if isinstance(p.vector, list)]
+        if len(real) >= sample_queries:
+            return np.asarray(real[:sample_queries], dtype=np.float32)
+
+        if real:
+            vector_size = len(real[0])
+        elif not vector_size:
+            # 未传入时从集合配置获取向量维度
+            vector_size = self.get_collection_info().get("config", {}).get("vector_size")
+        if not vector_size:
+            return None
+
+        # 随机向量一次生成并归一化（各方向均匀分布在单位球面上，贴近余弦检索的真实查询）
+        rng = np.random.default_rng()
+        filler = rng.standard_normal((sample_queries - len(real), vector_size), dtype=np.float32)
+        filler /= np.linalg.norm(filler, axis=1, keepdims=True)
+        if not real:
+            return filler
+        return np.vstack([np.asarray(real, dtype=np.float32), filler])
+
+    def get_optimization_recommendations(self, info: Optional[dict] = None) -> list:
         """
         获取优化建议
 
+        Args:
+            info: 集合信息（已获取时传入，省去一次查询）
+
         Returns:
             建议列表
         """
         recommendations = []
 
         try:
-            info = self.get_collection_info()
+            if info is None:
+                info = self.get_collection_info()
 
             if not info:
                 return ["无法获取集合信息，请检查 Qdrant 连接"]
@@ -288,6 +343,16 @@ class VectorIndexOptimizer:
                     "向量数量很大（>1M），建议使用分片部署和 'fast_search' 配置"
                 )
 
+            # 原始 FP32 向量超过本机可用内存时建议 INT8 量化（Qdrant 部署在其他机器时仅供参考）
+            vector_size = info.get("config", {}).get("vector_size") or 0
+            vectors_bytes = (vectors_count or 0) * vector_size * 4
+            available_ram = _available_ram_bytes()
+            if available_ram and vectors_bytes > available_ram:
+                recommendations.append(
+                    f"原始向量约 {vectors_bytes / 1024**3:.1f} GB，超过可用内存 "
+                    f"{available_ram / 1024**3:.1f} GB，建议使用 'balanced' 或 'fast_search' 配置启用 INT8 量化"
+                )
+
             # 索引状态建议
             if info.get("status") != "green":
                 recommendations.append(
@@ -359,7 +424,10 @@ class VectorIndexOptimizer:
                 result["steps"].append("索引优化超时")
 
         # 6. 预热索引
-        warmup_stats = self.warmup_index(sample_queries=50)
+        warmup_stats = self.warmup_index(
+            sample_queries=50,
+            vector_size=info.get("config", {}).get("vector_size"),
+        )
         result["warmup"] = warmup_stats
         result["steps"].append(f"索引预热完成，平均延迟: {warmup_stats['avg_time']*1000:.2f}ms")
 
@@ -367,7 +435,7 @@ class VectorIndexOptimizer:
         result["after"] = self.get_collection_info()
 
         # 8. 获取建议
-        result["recommendations"] = self.get_optimization_recommendations()
+        result["recommendations"] = self.get_optimization_recommendations(info=result["after"])
 
         logger.info("=" * 50)
         logger.info("优化流程完成")
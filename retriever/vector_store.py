@@ -1,35 +1,59 @@
 """
 向量检索
 """
-from typing import List, Dict, Optional
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from typing import AbstractSet, FrozenSet, List, Dict, Optional, Tuple, Union
+import uuid
+from functools import lru_cache
+import numpy as np
+from qdrant_client.models import Filter, FieldCondition, MatchValue, HasIdCondition, PayloadSelectorExclude
 
-from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS, TOP_K
+from config import QDRANT_COLLECTION_NAME, TOP_K
+from utils.config_manager import get_config
 from utils.embeddings import EmbeddingModel
 from utils.logger import logger
 
 
+def _to_point_id(normalized_id: str) -> Optional[Union[int, str]]:
+    """把标准化（无连字符）的 ID 还原为 Qdrant point ID，无法解析时返回 None"""
+    if normalized_id.isdigit():
+        return int(normalized_id)
+    try:
+        return str(uuid.UUID(hex=normalized_id))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=64)
+def _to_point_ids(allowed_ids: FrozenSet[str]) -> Tuple[Union[int, str], ...]:
+    """批量转换 point ID（同一用户的可访问集合在缓存期内是同一对象，可直接命中）"""
+    return tuple(pid for pid in map(_to_point_id, allowed_ids) if pid is not None)
+
+
 class VectorStore:
     """向量存储检索器"""
+
+    # 检索结果不需要的大字段，在 Qdrant 端剔除（知识条目的 original_content 与 content 基本重复）
+    SEARCH_PAYLOAD = PayloadSelectorExclude(exclude=["original_content"])
     
     def __init__(self):
         self.embedding_model = EmbeddingModel()
-        # 使用 URL 模式连接 Qdrant（明确指定 HTTP/HTTPS）
-        protocol = "https" if QDRANT_USE_HTTPS else "http"
-        url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-        self.qdrant_client = QdrantClient(
-            url=url,
-            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None
-        )
+        # 复用进程内共享的 Qdrant 客户端（URL 模式，明确指定 HTTP/HTTPS）
+        self.qdrant_client = get_config().qdrant_client
         self.collection_name = QDRANT_COLLECTION_NAME
     
+    def embed_batch(self, queries: List[str]) -> np.ndarray:
+        """一次前向/一次 API 请求批量生成多条查询的向量（已归一化）"""
+        return self.embedding_model.encode(queries, batch_size=max(len(queries), 1))
+
     def search(
         self,
         query: str,
         top_k: int = TOP_K,
         filters: Optional[Dict] = None,
-        score_threshold: float = 0.0
+        score_threshold: float = 0.0,
+        query_vector: Optional[np.ndarray] = None,
+        allowed_ids: Optional[AbstractSet[str]] = None,
+        with_vectors: bool = False
     ) -> List[Dict]:
         """
         向量检索
@@ -39,38 +63,47 @@ class VectorStore:
             top_k: 返回结果数量
             filters: 过滤条件，如 {"type": "code", "language": "php"}
             score_threshold: 相似度阈值
+            query_vector: 预先计算的查询向量，提供时跳过嵌入
+            allowed_ids: 允许返回的 point ID 集合（标准化格式），在 Qdrant 端过滤
+            with_vectors: 是否在结果中附带文档向量（"vector" 字段，用于 MMR 去重）
             
         Returns:
             检索结果列表
         """
-        # 生成查询向量
-        query_vector = self.embedding_model.encode([query])[0].tolist()
+        # 生成查询向量（调用方已计算时直接复用）
+        if query_vector is None:
+            query_vector = self.embedding_model.embed_query(query)
         
         # 构建过滤条件
-        qdrant_filter = None
+        conditions = []
         if filters:
-            conditions = []
             for key, value in filters.items():
                 conditions.append(
                     FieldCondition(key=key, match=MatchValue(value=value))
                 )
-            if conditions:
-                qdrant_filter = Filter(must=conditions)
+        if allowed_ids is not None:
+            point_ids = _to_point_ids(frozenset(allowed_ids))
+            if not point_ids:
+                return []
+            conditions.append(HasIdCondition(has_id=list(point_ids)))
+        qdrant_filter = Filter(must=conditions) if conditions else None
         
         # 执行检索
         try:
             results = self.qdrant_client.query_points(
                 collection_name=self.collection_name,
-                query=query_vector,
+                query=query_vector.tolist(),
                 limit=top_k,
                 query_filter=qdrant_filter,
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                with_payload=self.SEARCH_PAYLOAD,
+                with_vectors=with_vectors
             )
 
             # 格式化结果
             formatted_results = []
             for result in results.points:
-                formatted_results.append({
+                formatted = {
                     "id": str(result.id),  # 添加 Qdrant point ID，用于分组过滤
                     "content": result.payload.get("content", ""),
                     "file_path": result.payload.get("file_path", ""),
@@ -80,7 +113,10 @@ class VectorStore:
                         k: v for k, v in result.payload.items()
                         if k not in ["content", "file_path", "type"]
                     }
-                })
+                }
+                if with_vectors and isinstance(result.vector, list):
+                    formatted["vector"] = result.vector
+                formatted_results.append(formatted)
             
             logger.debug(f"检索到 {len(formatted_results)} 个结果")
             return formatted_results
@@ -20,8 +20,9 @@ sys.path.insert(0, str(project_root))
 
 from admin.database import engine, SessionLocal
 from admin.models import KnowledgeEntry, KnowledgeGroup, User, KnowledgeTask
-from qdrant_client import QdrantClient
-from config import QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY, QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
+from qdrant_client.models import Filter, IsEmptyCondition, PayloadField
+from config import QDRANT_COLLECTION_NAME
+from utils.config_manager import get_config
 from sqlalchemy import text
 from utils.logger import logger
 
@@ -44,16 +45,13 @@ def migrate_mysql():
                 AND COLUMN_NAME = 'user_id'
             """))
             if result.fetchone() is None:
+                # 加列和建索引合并为一条 ALTER，只做一次表变更
                 conn.execute(text("""
                     ALTER TABLE knowledge_entries
                     ADD COLUMN user_id INT DEFAULT 1,
-                    ADD COLUMN is_public BOOLEAN DEFAULT TRUE
-                """))
-                conn.execute(text("""
-                    CREATE INDEX idx_ke_user_id ON knowledge_entries(user_id)
-                """))
-                conn.execute(text("""
-                    CREATE INDEX idx_ke_is_public ON knowledge_entries(is_public)
+                    ADD COLUMN is_public BOOLEAN DEFAULT TRUE,
+                    ADD INDEX idx_ke_user_id (user_id),
+                    ADD INDEX idx_ke_is_public (is_public)
                 """))
                 logger.info("  ✓ knowledge_entries 表结构更新完成")
             else:
@@ -74,10 +72,8 @@ def migrate_mysql():
                 conn.execute(text("""
                     ALTER TABLE knowledge_groups
                     ADD COLUMN user_id INT DEFAULT 1,
-                    ADD COLUMN is_public BOOLEAN DEFAULT TRUE
-                """))
-                conn.execute(text("""
-                    CREATE INDEX idx_kg_user_id ON knowledge_groups(user_id)
+                    ADD COLUMN is_public BOOLEAN DEFAULT TRUE,
+                    ADD INDEX idx_kg_user_id (user_id)
                 """))
                 logger.info("  ✓ knowledge_groups 表结构更新完成")
             else:
@@ -156,12 +152,11 @@ def migrate_qdrant():
     logger.info("开始 Qdrant payload 迁移...")
     logger.info("=" * 50)
 
-    # 连接 Qdrant
-    protocol = "https" if QDRANT_USE_HTTPS else "http"
-    url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-    logger.info(f"连接 Qdrant: {url}")
+    # 连接 Qdrant（与验证步骤共用同一个客户端）
+    config = get_config()
+    logger.info(f"连接 Qdrant: {config.qdrant_url}")
 
-    client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+    client = config.qdrant_client
 
     # 获取 admin 用户 ID
     db = SessionLocal()
@@ -178,53 +173,36 @@ def migrate_qdrant():
         logger.warning(f"Collection 不存在或无法访问: {e}")
         return
 
-    # 滚动获取所有 points
-    offset = None
-    batch_size = 100
-    total_updated = 0
-    total_skipped = 0
-
-    while True:
-        result = client.scroll(
+    # 缺少 user_id 的 points 由服务端按过滤条件一次更新，不再逐页 scroll
+    missing_user = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="user_id"))])
+    to_update = client.count(
+        collection_name=QDRANT_COLLECTION_NAME,
+        count_filter=missing_user,
+        exact=True
+    ).count
+    total_skipped = total_points - to_update
+    logger.info(f"  待更新 {to_update} 个 points（缺少 user_id）")
+
+    if to_update:
+        # wait=True：随后的 verify_migration 要看到更新结果
+        client.set_payload(
             collection_name=QDRANT_COLLECTION_NAME,
-            limit=batch_size,
-            offset=offset,
-            with_payload=True,
-            with_vectors=False
+            payload={
+                "user_id": admin_id,
+                "is_public": True
+            },
+            points=missing_user,
+            wait=True
         )
 
-        points = result[0]
-        if not points:
-            break
-
-        # 批量更新 payload
-        points_to_update = []
-        for point in points:
-            # 跳过已有 user_id 的
-            if point.payload and "user_id" in point.payload:
-                total_skipped += 1
-                continue
-
-            points_to_update.append(point.id)
-
-        # 批量更新
-        if points_to_update:
-            client.set_payload(
-                collection_name=QDRANT_COLLECTION_NAME,
-                payload={
-                    "user_id": admin_id,
-                    "is_public": True
-                },
-                points=points_to_update
-            )
-            total_updated += len(points_to_update)
-
-        offset = result[1]  # 下一页 offset
-        if offset is None:
-            break
-
-        if total_updated > 0 and total_updated % 500 == 0:
-            logger.info(f"  进度: 已更新 {total_updated} 个 points...")
+    remaining = client.count(
+        collection_name=QDRANT_COLLECTION_NAME,
+        count_filter=missing_user,
+        exact=True
+    ).count
+    total_updated = to_update - remaining
+    if remaining:
+        logger.warning(f"  仍有 {remaining} 个 points 缺少 user_id")
 
     logger.info(f"  ✓ Qdrant 迁移完成: 更新 {total_updated} 个, 跳过 {total_skipped} 个")
 
@@ -254,9 +232,7 @@ def verify_migration():
         db.close()
 
     # 验证 Qdrant
-    protocol = "https" if QDRANT_USE_HTTPS else "http"
-    url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-    client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+    client = get_config().qdrant_client
 
     try:
         # 抽样检查
@@ -0,0 +1,45 @@
+"""
+将 Reranker 的 FP32 ONNX 模型动态量化为 INT8
+
+先导出 FP32 ONNX 模型，例如:
+    optimum-cli export onnx --model BAAI/bge-reranker-base --task text-classification models/reranker-onnx/
+
+再执行量化:
+    python scripts/quantize_reranker.py models/reranker-onnx/model.onnx models/reranker-onnx/model.int8.onnx
+
+最后在 .env 中设置 RERANKER_ONNX_PATH=models/reranker-onnx/model.int8.onnx
+
+也可以一步完成导出与量化（需安装 optimum[onnxruntime]，模型取自 RERANKER_MODEL_NAME），
+部署时执行一次，避免服务进程自行导出:
+    python scripts/quantize_reranker.py --export models/reranker-onnx/model.int8.onnx
+"""
+import os
+import sys
+
+
+def quantize(input_path: str, output_path: str):
+    """权重量化为 INT8（激活保持浮点，运行时动态量化）"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    print(f"量化完成: {output_path}")
+
+
+def export(output_path: str) -> bool:
+    """导出并量化 RERANKER_MODEL_NAME（与服务内自动导出共用同一实现）"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from retriever.reranker import export_onnx_model
+
+    ok = export_onnx_model(output_path)
+    print(f"导出完成: {output_path}" if ok else "导出失败，详见日志")
+    return ok
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--export":
+        sys.exit(0 if export(sys.argv[2]) else 1)
+    if len(sys.argv) != 3:
+        print("用法: python scripts/quantize_reranker.py <fp32.onnx> <int8.onnx>")
+        print("      python scripts/quantize_reranker.py --export <int8.onnx>")
+        sys.exit(1)
+    quantize(sys.argv[1], sys.argv[2])
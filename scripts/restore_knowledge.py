@@ -11,13 +11,12 @@ load_dotenv()
 
 import mysql.connector
 import uuid
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client.models import PointStruct, OptimizersConfigDiff
 
-from config import (
-    QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY,
-    QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS
-)
+from config import QDRANT_COLLECTION_NAME
+from utils.config_manager import get_config
 from utils.embeddings import get_embedding_model
 from utils.logger import logger
 
@@ -42,99 +41,151 @@ def restore_knowledge():
     logger.info(f"嵌入模型维度: {dim}")
 
     # 初始化 Qdrant 客户端
-    protocol = "https" if QDRANT_USE_HTTPS else "http"
-    url = f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
-    qdrant_client = QdrantClient(url=url, api_key=QDRANT_API_KEY if QDRANT_API_KEY else None)
+    qdrant_client = get_config().qdrant_client
 
-    # 从 MySQL 读取知识条目
+    # 批量处理（每批一次嵌入 API 调用；写入 Qdrant 由 upload_points 再分批并行）
+    batch_size = 256
+    upload_batch_size = 512
+    upload_parallel = 4
+    embed_workers = 3  # 同时在途的嵌入批次数
+
+    # 从 MySQL 读取知识条目（先查总数，正文按批流式读取，内存只占一批）
     logger.info("从 MySQL 读取知识条目...")
     conn = get_mysql_connection()
-    cursor = conn.cursor(dictionary=True)
+    count_cursor = conn.cursor()
+    count_cursor.execute('SELECT COUNT(*) FROM knowledge_entries')
+    total = count_cursor.fetchone()[0]
+    count_cursor.close()
+    logger.info(f"共找到 {total} 条知识记录")
+
+    if not total:
+        logger.warning("没有找到知识记录")
+        conn.close()
+        return
 
+    cursor = conn.cursor(dictionary=True, buffered=False)
     cursor.execute('''
         SELECT id, qdrant_id, title, category, summary, keywords,
                tech_stack, content_preview, created_at
         FROM knowledge_entries
         ORDER BY id
     ''')
-    entries = cursor.fetchall()
-    logger.info(f"共找到 {len(entries)} 条知识记录")
-
-    if not entries:
-        logger.warning("没有找到知识记录")
-        return
 
-    # 批量处理
-    batch_size = 10
-    success_count = 0
-
-    for i in range(0, len(entries), batch_size):
-        batch = entries[i:i+batch_size]
-
-        # 准备文本和元数据
-        texts = []
-        metadatas = []
-
-        for entry in batch:
-            content = entry['content_preview'] or ''
-            if not content.strip():
-                continue
-
-            texts.append(content)
-            metadatas.append({
-                'mysql_id': entry['id'],
-                'title': entry['title'] or '',
-                'category': entry['category'] or 'general',
-                'summary': entry['summary'] or '',
-                'keywords': entry['keywords'] if entry['keywords'] else [],
-                'tech_stack': entry['tech_stack'] if entry['tech_stack'] else [],
-                'created_at': str(entry['created_at']) if entry['created_at'] else '',
-                'file_path': f"knowledge/{entry['qdrant_id'][:8]}",
-                'type': 'knowledge'
-            })
-
-        if not texts:
-            continue
-
-        # 生成嵌入向量
-        logger.info(f"处理批次 {i//batch_size + 1}: {len(texts)} 条记录")
-        try:
-            embeddings = embedding_model.encode(texts)
+    # 写入成功后回填 MySQL 的 (qdrant_id, 条目 id)
+    id_updates = []
+
+    def read_batches():
+        """逐批读取条目，产出 (批次号, 文本列表, 元数据列表)"""
+        batch_no = 0
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            batch_no += 1
+
+            # 准备文本和元数据
+            texts = []
+            metadatas = []
+
+            for entry in batch:
+                content = entry['content_preview'] or ''
+                if not content.strip():
+                    continue
+
+                texts.append(content)
+                metadatas.append({
+                    'mysql_id': entry['id'],
+                    'title': entry['title'] or '',
+                    'category': entry['category'] or 'general',
+                    'summary': entry['summary'] or '',
+                    'keywords': entry['keywords'] if entry['keywords'] else [],
+                    'tech_stack': entry['tech_stack'] if entry['tech_stack'] else [],
+                    'created_at': str(entry['created_at']) if entry['created_at'] else '',
+                    'file_path': f"knowledge/{entry['qdrant_id'][:8]}",
+                    'type': 'knowledge'
+                })
+
+            if texts:
+                yield batch_no, texts, metadatas
+
+    def iter_points():
+        """
+        产出 PointStruct
+
+        嵌入在线程池中进行，最多 embed_workers 批同时在途：后面几批嵌入的同时，
+        前面的批次已交给 upload_points 的上传进程；按批次顺序产出，在途批数即背压上限。
+        """
+        pending = deque()
+
+        def drain_one():
+            batch_no, texts, metadatas, future = pending.popleft()
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                logger.error(f"处理批次 {batch_no} 失败: {e}")
+                return
 
             # 创建 Qdrant points
-            points = []
-            for j, (embedding, metadata) in enumerate(zip(embeddings, metadatas)):
+            for text, embedding, metadata in zip(texts, embeddings, metadatas):
                 point_id = str(uuid.uuid4())
-                points.append(PointStruct(
+                id_updates.append((point_id, metadata['mysql_id']))
+                yield PointStruct(
                     id=point_id,
                     vector=embedding.tolist(),
                     payload={
-                        'content': texts[j],
+                        'content': text,
                         **metadata
                     }
-                ))
-
-            # 写入 Qdrant
-            qdrant_client.upsert(
-                collection_name=QDRANT_COLLECTION_NAME,
-                points=points
+                )
+
+        with ThreadPoolExecutor(max_workers=embed_workers) as executor:
+            for batch_no, texts, metadatas in read_batches():
+                # 生成嵌入向量
+                logger.info(f"处理批次 {batch_no}: {len(texts)} 条记录")
+                pending.append((batch_no, texts, metadatas, executor.submit(embedding_model.encode, texts)))
+                if len(pending) >= embed_workers:
+                    yield from drain_one()
+            while pending:
+                yield from drain_one()
+
+    # 批量写入期间关闭 HNSW 索引构建（indexing_threshold=0），结束后恢复原阈值，只在最终数据上建一次索引
+    collection_info = qdrant_client.get_collection(QDRANT_COLLECTION_NAME)
+    indexing_threshold = collection_info.config.optimizer_config.indexing_threshold
+    if indexing_threshold is None:
+        indexing_threshold = 20000
+    qdrant_client.update_collection(
+        collection_name=QDRANT_COLLECTION_NAME,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+    )
+    logger.info(f"已暂停索引构建（原 indexing_threshold={indexing_threshold}）")
+
+    try:
+        # 写入 Qdrant（边读边嵌入边上传，多线程分批上传）
+        qdrant_client.upload_points(
+            collection_name=QDRANT_COLLECTION_NAME,
+            points=iter_points(),
+            batch_size=upload_batch_size,
+            parallel=upload_parallel,
+            wait=True
+        )
+        cursor.close()
+        success_count = len(id_updates)
+        logger.info(f"成功写入 {success_count} 条记录")
+
+        # 更新 MySQL 中的 qdrant_id（流式游标已读完，可在同一连接上执行）
+        if id_updates:
+            update_cursor = conn.cursor()
+            update_cursor.executemany(
+                'UPDATE knowledge_entries SET qdrant_id = %s WHERE id = %s',
+                id_updates
             )
-
-            success_count += len(points)
-            logger.info(f"成功写入 {len(points)} 条记录")
-
-            # 更新 MySQL 中的 qdrant_id
-            for point, entry in zip(points, batch):
-                if entry['content_preview']:
-                    cursor.execute(
-                        'UPDATE knowledge_entries SET qdrant_id = %s WHERE id = %s',
-                        (point.id, entry['id'])
-                    )
             conn.commit()
-
-        except Exception as e:
-            logger.error(f"处理批次失败: {e}")
-            continue
+    finally:
+        qdrant_client.update_collection(
+            collection_name=QDRANT_COLLECTION_NAME,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+        )
+        logger.info(f"已恢复索引构建（indexing_threshold={indexing_threshold}）")
 
     conn.close()
     logger.info(f"恢复完成！共成功恢复 {success_count} 条知识")
@@ -0,0 +1,80 @@
+"""
+字面查询识别与 Reranker 跳过分支测试
+"""
+import pytest
+
+import retriever.hybrid_search as hybrid_search
+from retriever.hybrid_search import HybridSearch, _is_literal_query
+
+
+@pytest.mark.parametrize("query", [
+    '"connection refused"',      # 引号短语
+    "config.py",                 # 文件名
+    "get_user_id",               # 下划线标识符
+    "HybridSearch",              # 驼峰
+    "utils/ttl_cache",           # 路径
+    "std::vector",               # 命名空间
+    "#deploy",                   # 标签
+    "ERR404",                    # 含数字的错误码
+])
+def test_literal_queries(query):
+    assert _is_literal_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "python",                    # 普通英文单词
+    "nginx",
+    "how to deploy",             # 含空白的自然语言
+    "如何配置向量数据库？",        # 中文问题
+    "config.py 怎么改",           # 文件名夹在句子里
+])
+def test_non_literal_queries(query):
+    assert not _is_literal_query(query)
+
+
+class _RecordingReranker:
+    def __init__(self):
+        self.calls = []
+
+    def rerank(self, query, docs, top_k):
+        self.calls.append(query)
+        return docs[:top_k]
+
+
+@pytest.fixture
+def searcher(monkeypatch):
+    monkeypatch.setattr(hybrid_search, "RERANKER_SKIP_LITERAL", True)
+    monkeypatch.setattr(hybrid_search, "RERANKER_MIN_CANDIDATES", 0)
+    search = HybridSearch.__new__(HybridSearch)
+    search._reranker = _RecordingReranker()
+    monkeypatch.setattr(search, "_get_reranker", lambda: search._reranker, raising=False)
+    return search
+
+
+def _candidates(n=5):
+    return [
+        {"id": f"id{i}", "content": f"doc {i}", "score": 1 - i * 0.1,
+         "keyword_score": 1.0 if i == 0 else 0.0, "vector": [0.0, 1.0]}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("query", ['"connection refused"', "config.py", "get_user_id"])
+def test_finalize_skips_reranker_for_literal_query(searcher, query):
+    results = searcher._finalize_results(query, _candidates(), top_k=2, use_reranker=True, use_mmr=False)
+    assert searcher._reranker.calls == []
+    assert [r["id"] for r in results] == ["id0", "id1"]
+    assert all("vector" not in r and "preview" in r for r in results)
+
+
+@pytest.mark.parametrize("query", ["python", "如何配置向量数据库？"])
+def test_finalize_reranks_natural_query(searcher, query):
+    searcher._finalize_results(query, _candidates(), top_k=2, use_reranker=True, use_mmr=False)
+    assert searcher._reranker.calls == [query]
+
+
+def test_finalize_reranks_literal_query_without_keyword_hit(searcher):
+    candidates = _candidates()
+    candidates[0]["keyword_score"] = 0.0
+    searcher._finalize_results("config.py", candidates, top_k=2, use_reranker=True, use_mmr=False)
+    assert searcher._reranker.calls == ["config.py"]
@@ -0,0 +1,72 @@
+"""
+跨进程共享的缓存版本号（SQLite WAL）
+
+多 worker 部署时各进程的内存缓存互不可见，只清本进程的缓存无法让其他 worker 失效。
+失效方递增命名版本号，各进程读取缓存前比对版本号，版本变化即视为旧条目全部失效。
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from config import BASE_DIR
+from utils.logger import logger
+
+# 默认存放在 data/ 下，与关键词索引同目录
+DEFAULT_DB_PATH = BASE_DIR / "data" / "cache_version.db"
+
+
+class SharedCacheVersion:
+    """命名的缓存版本号，读取为单行查询（每线程复用连接），递增为单条 UPSERT"""
+
+    def __init__(self, name: str, db_path: Optional[str] = None):
+        self.name = name
+        self.db_path = str(db_path or DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程的 SQLite 连接（首次使用时建表）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=1.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS cache_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+                    )
+                    self._ready = True
+        return conn
+
+    def get(self) -> Optional[int]:
+        """
+        读取当前版本号（从未递增过为 0）
+
+        Returns:
+            版本号；读取失败返回 None，调用方应绕过缓存
+        """
+        try:
+            row = self._conn().execute(
+                "SELECT version FROM cache_version WHERE name = ?", (self.name,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取缓存版本号失败 ({self.name}): {e}")
+            return None
+        return row[0] if row else 0
+
+    def bump(self):
+        """递增版本号，使所有进程中基于旧版本的缓存失效"""
+        try:
+            self._conn().execute(
+                "INSERT INTO cache_version (name, version) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                (self.name,)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"递增缓存版本号失败 ({self.name}): {e}")
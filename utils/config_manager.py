@@ -1,11 +1,13 @@
 """
 配置管理单例 - 统一管理所有配置读取
 """
-from functools import lru_cache
-from typing import Dict, Optional
+import threading
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 from config import (
     QDRANT_HOST, QDRANT_PORT, QDRANT_API_KEY,
-    QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS,
+    QDRANT_COLLECTION_NAME, QDRANT_USE_HTTPS, QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT,
     LLM_PROVIDER, LLM_MODEL, ANTHROPIC_API_KEY, ANTHROPIC_API_BASE,
     OPENAI_API_KEY, OPENAI_API_BASE
 )
@@ -16,26 +18,30 @@ class ConfigManager:
     配置管理单例
 
     提供统一的配置访问接口,避免在多处重复读取环境变量
-    使用 @lru_cache 缓存配置对象,提升性能
+    使用 cached_property 缓存配置对象(首次访问后存入实例 __dict__),返回只读映射;
+    Qdrant 客户端在多线程下首次创建,单例与客户端均加锁(Python 3.12 起 cached_property 不再加锁)
     """
     _instance = None
+    _qdrant_client = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
 
-    @property
-    @lru_cache(maxsize=1)
-    def qdrant_config(self) -> Dict[str, any]:
+    @cached_property
+    def qdrant_config(self) -> Mapping[str, Any]:
         """Qdrant 向量数据库配置"""
-        return {
+        return MappingProxyType({
             'host': QDRANT_HOST,
             'port': QDRANT_PORT,
             'api_key': QDRANT_API_KEY,
             'collection': QDRANT_COLLECTION_NAME,
             'use_https': QDRANT_USE_HTTPS
-        }
+        })
 
     @property
     def qdrant_url(self) -> str:
@@ -44,17 +50,36 @@ class ConfigManager:
         return f"{protocol}://{QDRANT_HOST}:{QDRANT_PORT}"
 
     @property
-    @lru_cache(maxsize=1)
-    def llm_config(self) -> Dict[str, Optional[str]]:
+    def qdrant_client(self):
+        """进程内共享的 Qdrant 客户端（复用连接池；QDRANT_PREFER_GRPC 开启时走 gRPC）"""
+        if self._qdrant_client is None:
+            with self._lock:
+                if self._qdrant_client is None:
+                    self._qdrant_client = self._create_qdrant_client()
+        return self._qdrant_client
+
+    def _create_qdrant_client(self):
+        """创建 Qdrant 客户端"""
+        from qdrant_client import QdrantClient
+
+        return QdrantClient(
+            url=self.qdrant_url,
+            api_key=QDRANT_API_KEY if QDRANT_API_KEY else None,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT
+        )
+
+    @cached_property
+    def llm_config(self) -> Mapping[str, Optional[str]]:
         """LLM 配置"""
-        return {
+        return MappingProxyType({
             'provider': LLM_PROVIDER,
             'model': LLM_MODEL,
             'anthropic_api_key': ANTHROPIC_API_KEY,
             'anthropic_api_base': ANTHROPIC_API_BASE,
             'openai_api_key': OPENAI_API_KEY,
             'openai_api_base': OPENAI_API_BASE
-        }
+        })
 
 
 def get_config() -> ConfigManager:
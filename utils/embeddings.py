@@ -2,12 +2,84 @@
 嵌入模型工具 - 支持本地模型和 API 调用
 """
 import os
+import queue
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
 import numpy as np
-from typing import List, Union
+from typing import Callable, List, Optional, Union
 import httpx
 
 from utils.logger import logger
 
+# 查询向量缓存容量（同一问题原样重复提问时直接命中，不再调用嵌入模型）
+QUERY_EMBEDDING_CACHE_SIZE = 256
+# 并发查询合并嵌入的单批上限
+QUERY_EMBEDDING_MAX_BATCH = 32
+# 等待合并线程返回查询向量的上限（秒），大于 API 单次请求超时
+QUERY_EMBEDDING_TIMEOUT = 120
+
+
+class QueryEmbeddingBatcher:
+    """
+    并发查询嵌入合并器
+
+    多个请求线程同时生成查询向量时，由后台线程把排队中的文本合并为一次
+    encode 调用（一次 API 请求 / 一次前向计算）。空闲时请求立即处理，不引入额外等待。
+    """
+
+    def __init__(self, encode_func: Callable[[List[str]], np.ndarray], max_batch_size: int = QUERY_EMBEDDING_MAX_BATCH):
+        self._encode_func = encode_func
+        self._max_batch_size = max_batch_size
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """懒启动后台合并线程（线程意外退出时重新拉起）"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    daemon=True,
+                    name="query-embedding-batcher"
+                )
+                self._worker.start()
+
+    def embed(self, text: str) -> np.ndarray:
+        """提交单条文本并等待其向量"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result(timeout=QUERY_EMBEDDING_TIMEOUT)
+
+    def _run(self):
+        while True:
+            # 阻塞等待第一条，再把已排队的请求一并取出
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                # 相同文本只嵌入一次
+                texts = list(dict.fromkeys(text for text, _ in batch))
+                vectors = self._encode_func(texts)
+                by_text = dict(zip(texts, vectors))
+                for text, future in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                # 任何异常都不能让线程退出或让等待方悬挂：未完成的请求一律带上异常返回
+                logger.warning(f"查询向量合并批次失败: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
 
 class APIEmbeddingModel:
     """API 嵌入模型(OpenAI 格式)"""
@@ -128,9 +200,14 @@ class EmbeddingModel:
             cls._instance = super().__new__(cls)
         return cls._instance
 
+    _query_batcher = None
+
     def __init__(self):
         if self._model is None:
             self._model = self._create_model()
+        if self._query_batcher is None:
+            # 通过 self._model 间接调用，热重载后自动使用新模型
+            self._query_batcher = QueryEmbeddingBatcher(lambda texts: self._model.encode(texts))
 
     def _create_model(self):
         """根据配置创建嵌入模型(优先数据库 > 环境变量)"""
@@ -172,6 +249,8 @@ class EmbeddingModel:
         if new_provider_id != self._last_provider_id:
             logger.info(f"检测到嵌入供应商变更,重新加载模型 (旧: {self._last_provider_id}, 新: {new_provider_id})")
             self._model = self._create_model()
+            # 供应商变更后旧向量不再有效
+            self._embed_query_cached.cache_clear()
             return True
         return False
 
@@ -213,6 +292,23 @@ class EmbeddingModel:
         """生成嵌入向量"""
         return self._model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
 
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        生成单条查询的嵌入向量（已归一化）
+
+        同一次问答中语义缓存与向量检索应复用此结果，避免重复调用嵌入模型；
+        完全相同的问题命中进程内 LRU 缓存，并发的不同问题合并为一次批量嵌入。
+        返回的数组为只读，需要修改时请先 copy。
+        """
+        return self._embed_query_cached(text)
+
+    @lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+    def _embed_query_cached(self, text: str) -> np.ndarray:
+        """按原始文本缓存查询向量（单例实例，缓存键即文本本身）"""
+        vector = self._query_batcher.embed(text)
+        vector.flags.writeable = False
+        return vector
+
     def get_embedding_dim(self):
         """获取嵌入维度"""
         return self._model.get_embedding_dim()
@@ -215,6 +215,10 @@ class KnowledgeTaskQueue:
                     if groups:
                         db.commit()
 
+                # 新知识影响用户可访问范围
+                from retriever.hybrid_search import invalidate_user_access_cache
+                invalidate_user_access_cache()
+
                 # 更新任务状态为完成
                 task = db.query(KnowledgeTask).filter(KnowledgeTask.id == task_id).first()
                 if task: